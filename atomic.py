@@ -0,0 +1,28 @@
+"""
+Atomic file writes for caches, indexes and manifests. Content is written to a
+temporary file next to its target and moved into place, so concurrent readers and
+interrupted runs never see a partial file.
+"""
+
+import contextlib
+import os
+import tempfile
+
+
+def write_atomic(path, data):
+    """
+    Replaces the content of a file in one step.
+    :param path: File to write, its directory is created when missing
+    :param data: Content, bytes or text written as UTF-8
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,137 @@
+"""
+Model backends: OpenAI, a local Ollama server, and a deterministic fake with
+configurable latency for offline benchmarks. Each backend wraps a LangChain chat
+model with the name used for caching and token counting and the way it is asked
+for JSON output.
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+# langchain and the provider packages are imported when a backend is created.
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+BACKENDS = ("openai", "ollama", "fake")
+DEFAULT_MODELS = {"openai": "gpt-4o", "ollama": "llama3:latest", "fake": "fake"}
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+FOLDER_NAME = re.compile(r"for `([^`]+)`")
+TERRAFORM_BLOCK = re.compile(
+    r'^\s*(resource|module|data)\s+"([^"]+)"(?:\s+"([^"]+)")?', re.MULTILINE
+)
+
+
+def fake_reply(prompt: str) -> str:
+    """
+    Deterministic answer of the fake model to the last message of a request.
+    """
+    folder = FOLDER_NAME.search(prompt)
+    folder = folder.group(1) if folder else "infrastructure"
+    blocks = sorted(
+        {" ".join(filter(None, b)) for b in TERRAFORM_BLOCK.findall(prompt)}
+    )
+    diagram_code = (
+        "from diagrams import Diagram\n"
+        "from diagrams.aws.general import General\n\n"
+        f'with Diagram("{folder}", show=False, filename="architecture"):\n'
+        f'    General("{folder}")\n'
+    )
+    if "Summarise part" in prompt:
+        return "\n".join(f"- {block}" for block in blocks) or "- no resources"
+    if "fails validation" in prompt:
+        return json.dumps({"diagram_code": diagram_code})
+    readme = f"# {folder}\n\n## Key Components\n" + "".join(
+        f"- `{block}`\n" for block in blocks
+    )
+    return json.dumps({"readme": readme, "diagram_code": diagram_code})
+
+
+def fake_usage(prompt: str, reply: str) -> dict:
+    """
+    Token usage of the fake model, estimated as four characters per token.
+    """
+    input_tokens, output_tokens = len(prompt) // 4, len(reply) // 4
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+@dataclass
+class Backend:
+    """
+    A chat model and how to use it.
+    :param name: Backend name, one of BACKENDS
+    :param model: Model name, part of the cache key and used for token counting
+    :param llm: LangChain chat model
+    :param json_options: Call options constraining the response to a JSON object
+    """
+
+    name: str
+    model: str
+    llm: "BaseChatModel"
+    json_options: dict = field(default_factory=dict)
+
+    def structured(self):
+        """
+        :return: The chat model bound to answer with a JSON object
+        """
+        return self.llm.bind(**self.json_options) if self.json_options else self.llm
+
+
+def create_backend(
+    name="openai",
+    model=None,
+    timeout=None,
+    base_url=None,
+    latency=0.0,
+    tokens_per_second=0.0,
+):
+    """
+    Builds a backend. Provider packages are only imported when they are used.
+    :param name: One of BACKENDS
+    :param model: Model name, DEFAULT_MODELS[name] when None
+    :param timeout: Request timeout in seconds
+    :param base_url: Server URL, the provider default when None
+    :param latency: Fake backend: seconds before the first token
+    :param tokens_per_second: Fake backend: generation speed, 0 for instant
+    :return: Backend
+    """
+    model = model or DEFAULT_MODELS[name]
+    if name == "openai":
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError("OPENAI_API_KEY is not set")
+        from langchain_openai import ChatOpenAI
+
+        # Retries are handled by the shared RateLimiter, which needs the rate-limit headers.
+        llm = ChatOpenAI(
+            model=model,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            include_response_headers=True,
+            stream_usage=True,
+        )
+        return Backend(name, model, llm, {"response_format": {"type": "json_object"}})
+    if name == "ollama":
+        from langchain_ollama import ChatOllama
+
+        llm = ChatOllama(
+            model=model,
+            base_url=base_url or DEFAULT_OLLAMA_URL,
+            client_kwargs={"timeout": timeout},
+        )
+        return Backend(name, model, llm, {"format": "json"})
+    if name == "fake":
+        from fake_model import FakeChatModel
+
+        llm = FakeChatModel(
+            model_name=model, latency=latency, tokens_per_second=tokens_per_second
+        )
+        return Backend(name, model, llm)
+    raise ValueError(f"Unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,131 @@
+"""
+Batch API submission for full-repository runs that do not need interactive latency.
+Requests are written as a JSONL batch file, submitted through the OpenAI batch
+interface and polled until the results can be demultiplexed per folder.
+"""
+
+import json
+import logging
+import time
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_INTERVAL = 30.0
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+logger = logging.getLogger(__name__)
+
+
+def batch_request(
+    custom_id: str, model: str, messages, response_format: dict | None = None
+) -> dict:
+    """
+    Builds one line of a batch file.
+    :param custom_id: Identifier returned with the result, the folder name
+    :param model: Model that answers the request
+    :param messages: Prompt messages built with promtps
+    :param response_format: Response format of the request, e.g. a JSON object
+    """
+    body = {
+        "model": model,
+        "messages": [
+            {"role": ROLES[message.type], "content": message.content}
+            for message in messages
+        ],
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body,
+    }
+
+
+def write_batch_file(requests, path):
+    """
+    Writes batch requests as JSONL.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(request) + "\n" for request in requests)
+
+
+def submit_batch(client, path):
+    """
+    Uploads a batch file and creates the batch.
+    :param client: openai.OpenAI client
+    :param path: JSONL file written with write_batch_file
+    :return: Batch id
+    """
+    with open(path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    logger.info("Submitted batch %s from %s", batch.id, path)
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Polls a batch until it reaches a terminal status.
+    :return: The batch object
+    """
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        logger.info(
+            "Batch %s is %s (%s/%s completed, %s failed)",
+            batch_id,
+            batch.status,
+            counts.completed if counts else "?",
+            counts.total if counts else "?",
+            counts.failed if counts else "?",
+        )
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def parse_results(output_text, error_text=""):
+    """
+    Demultiplexes batch output and error files by custom_id.
+    :param output_text: Content of the batch output file
+    :param error_text: Content of the batch error file
+    :return: Dict custom_id -> {"content", "usage"} or {"error"}
+    """
+    results = {}
+    for line in (output_text + "\n" + error_text).splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) != 200:
+            error = record.get("error") or body.get("error") or body
+            results[record["custom_id"]] = {"error": json.dumps(error)}
+            continue
+        results[record["custom_id"]] = {
+            "content": body["choices"][0]["message"]["content"],
+            "usage": body.get("usage") or {},
+        }
+    return results
+
+
+def fetch_results(client, batch):
+    """
+    Downloads and parses the output and error files of a finished batch.
+    :return: Dict custom_id -> result, see parse_results
+    """
+    output_text = (
+        client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+    )
+    error_text = (
+        client.files.content(batch.error_file_id).text if batch.error_file_id else ""
+    )
+    return parse_results(output_text, error_text)
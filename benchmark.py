@@ -0,0 +1,662 @@
+"""
+End-to-end benchmark of the documentation pipeline.
+Synthetic Terraform/CDK repositories are documented by process_repository against
+a local OpenAI-compatible fake model server, and the wall time, per-stage timings,
+prompt size, peak memory and throughput of each scenario are written as JSON so
+results can be compared across commits.
+
+    python benchmark.py run --scenarios 10,100,stack --output bench.json
+    python benchmark.py compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Scenario name -> (folders, Terraform resources per folder)
+SCENARIOS = {
+    "10": (10, 12),
+    "100": (100, 12),
+    "1000": (1000, 12),
+    "stack": (1, 2500),
+}
+DEFAULT_SCENARIOS = "10,100,stack"
+DEFAULT_TTFT = 0.5
+DEFAULT_TOKENS_PER_SECOND = 400.0
+DEFAULT_OUTPUT_TOKENS = 600
+DEFAULT_CONCURRENCY = 16
+STAGES = ("collect", "prompt", "model", "parse", "write")
+
+RESOURCE_TYPES = (
+    "aws_instance",
+    "aws_s3_bucket",
+    "aws_lambda_function",
+    "aws_iam_role",
+    "aws_security_group",
+    "aws_subnet",
+    "aws_db_instance",
+    "aws_sqs_queue",
+    "aws_sns_topic",
+    "aws_dynamodb_table",
+    "aws_lb",
+    "aws_cloudwatch_log_group",
+)
+
+CDK_STACK = """import * as cdk from "aws-cdk-lib";
+import * as s3 from "aws-cdk-lib/aws-s3";
+import * as lambda from "aws-cdk-lib/aws-lambda";
+
+export class {name}Stack extends cdk.Stack {{
+  constructor(scope: cdk.App, id: string) {{
+    super(scope, id);
+    const bucket = new s3.Bucket(this, "{name}Bucket");
+    const handler = new lambda.Function(this, "{name}Handler", {{
+      runtime: lambda.Runtime.NODEJS_18_X,
+      handler: "index.handler",
+      code: lambda.Code.fromAsset("lambda"),
+    }});
+    bucket.grantRead(handler);
+  }}
+}}
+"""
+
+
+def _terraform_resource(rng, index, previous):
+    resource_type = rng.choice(RESOURCE_TYPES)
+    reference = f"  depends_on = [{previous}]\n" if previous else ""
+    return (
+        f'resource "{resource_type}" "r{index}" {{\n'
+        f'  name = "r{index}-${{var.environment}}"\n'
+        f"{reference}"
+        "  tags = {\n"
+        '    Owner       = "platform"\n'
+        "    Environment = var.environment\n"
+        "  }\n"
+        "}\n\n"
+    ), f"{resource_type}.r{index}"
+
+
+def synthetic_repo(path, folders, resources, seed=0):
+    """
+    Writes a synthetic infrastructure repository: one folder per stack with
+    main.tf, variables.tf and outputs.tf, and a CDK stack in every fifth folder.
+    :param path: Directory to create
+    :param folders: Number of stack folders
+    :param resources: Terraform resources per folder
+    :param seed: Seed making the repository reproducible
+    """
+    rng = random.Random(seed)
+    for folder_index in range(folders):
+        folder = os.path.join(path, f"stack-{folder_index:04d}")
+        os.makedirs(folder, exist_ok=True)
+        previous, blocks = None, []
+        for index in range(resources):
+            block, address = _terraform_resource(rng, index, previous)
+            blocks.append(block)
+            previous = address if rng.random() < 0.5 else None
+        with open(os.path.join(folder, "main.tf"), "w", encoding="utf-8") as f:
+            f.writelines(blocks)
+        with open(os.path.join(folder, "variables.tf"), "w", encoding="utf-8") as f:
+            f.write(
+                'variable "environment" {\n  type    = string\n  default = "dev"\n}\n'
+            )
+        with open(os.path.join(folder, "outputs.tf"), "w", encoding="utf-8") as f:
+            f.write(f'output "last" {{\n  value = {previous or "null"}\n}}\n')
+        if folder_index % 5 == 4:
+            with open(os.path.join(folder, "stack.ts"), "w", encoding="utf-8") as f:
+                f.write(CDK_STACK.format(name=f"Stack{folder_index}"))
+
+
+INVALID_DIAGRAM = (
+    "from diagrams import Diagram\n"
+    "from diagrams.aws.unknown import Thing\n\n"
+    'with Diagram("invalid", show=False):\n'
+    '    Thing("thing")\n'
+)
+
+
+def _chat_completion(completion, reply, usage):
+    return {
+        **completion,
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": usage,
+    }
+
+
+def _uploaded_file(content_type, body):
+    """
+    :return: Content of the file part of a multipart/form-data upload
+    """
+    message = BytesParser(policy=policy.default).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    for part in message.iter_parts():
+        if part.get_filename():
+            return part.get_payload(decode=True)
+    raise ValueError("No file in upload")
+
+
+class FakeModelServer:
+    """
+    Local OpenAI-compatible server answering with the fake backend's replies.
+    Chat completions come after `ttft` seconds plus `output_tokens` at
+    `tokens_per_second`, streamed or not. Batch files are uploaded to /files and
+    answered at once by /batches, with the output and error files served back.
+    :param failing: custom_ids of batch requests answered with an error
+    :param invalid_diagrams: custom_ids of batch requests answered with a diagram
+        that fails validation
+    """
+
+    def __init__(
+        self,
+        ttft=DEFAULT_TTFT,
+        tokens_per_second=DEFAULT_TOKENS_PER_SECOND,
+        output_tokens=DEFAULT_OUTPUT_TOKENS,
+        failing=(),
+        invalid_diagrams=(),
+    ):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parts = self.path.rstrip("/").split("/")
+                if parts[-2] == "batches" and parts[-1] in server.batches:
+                    self._send(json.dumps(server.batches[parts[-1]]).encode("utf-8"))
+                elif parts[-1] == "content" and parts[-2] in server.files:
+                    self._send(server.files[parts[-2]], "application/octet-stream")
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.path.endswith("/files"):
+                    file_id = server.store(
+                        _uploaded_file(self.headers["Content-Type"], body)
+                    )
+                    self._send(json.dumps(server.file_object(file_id)).encode("utf-8"))
+                    return
+                request = json.loads(body)
+                if self.path.endswith("/batches"):
+                    batch = server.run_batch(request)
+                    # Created first, completed when polled.
+                    self._send(json.dumps({**batch, "status": "validating"}).encode())
+                    return
+                reply, usage = server.answer(request)
+                time.sleep(server.ttft)
+                generation = server.output_tokens / server.tokens_per_second
+                completion = {
+                    "id": "chatcmpl-benchmark",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                }
+                if request.get("stream"):
+                    self._stream(completion, reply, usage, generation)
+                    return
+                time.sleep(generation)
+                self._send(
+                    json.dumps(_chat_completion(completion, reply, usage)).encode()
+                )
+
+            def _send(self, body, content_type="application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, completion, reply, usage, generation):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [reply[i : i + 16] for i in range(0, len(reply), 16)]
+                self._event(
+                    completion,
+                    [{"index": 0, "delta": {"role": "assistant", "content": ""}}],
+                )
+                for piece in pieces:
+                    time.sleep(generation / len(pieces))
+                    self._event(completion, [{"index": 0, "delta": {"content": piece}}])
+                self._event(
+                    completion, [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                )
+                self._event(completion, [], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def _event(self, completion, choices, usage=None):
+                chunk = {**completion, "object": "chat.completion.chunk"}
+                chunk["choices"] = choices
+                if usage:
+                    chunk["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failing = set(failing)
+        self.invalid_diagrams = set(invalid_diagrams)
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def answer(self, request):
+        """
+        :return: Tuple (reply, usage in the OpenAI format) of a chat request
+        """
+        from backends import fake_reply, fake_usage
+
+        reply = fake_reply(request["messages"][-1]["content"])
+        usage = fake_usage("".join(m["content"] for m in request["messages"]), reply)
+        return reply, {
+            "prompt_tokens": usage["input_tokens"],
+            "completion_tokens": usage["output_tokens"],
+            "total_tokens": usage["total_tokens"],
+        }
+
+    def store(self, content):
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = content
+        return file_id
+
+    def file_object(self, file_id):
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(self.files[file_id]),
+            "created_at": int(time.time()),
+            "filename": f"{file_id}.jsonl",
+            "purpose": "batch",
+            "status": "processed",
+        }
+
+    def run_batch(self, request):
+        """
+        Answers every request of an uploaded batch file and records the batch
+        as completed, with its output and error files.
+        """
+        outputs, errors = [], []
+        for line in self.files[request["input_file_id"]].decode().splitlines():
+            item = json.loads(line)
+            custom_id = item["custom_id"]
+            if custom_id in self.failing:
+                errors.append(
+                    {
+                        "id": f"batch_req_{custom_id}",
+                        "custom_id": custom_id,
+                        "response": {
+                            "status_code": 400,
+                            "body": {
+                                "error": {
+                                    "message": f"{custom_id} was rejected",
+                                    "type": "invalid_request_error",
+                                }
+                            },
+                        },
+                        "error": None,
+                    }
+                )
+                continue
+            reply, usage = self.answer(item["body"])
+            if custom_id in self.invalid_diagrams:
+                reply = json.dumps(
+                    {**json.loads(reply), "diagram_code": INVALID_DIAGRAM}
+                )
+            completion = {
+                "id": f"chatcmpl-{custom_id}",
+                "created": int(time.time()),
+                "model": item["body"]["model"],
+            }
+            outputs.append(
+                {
+                    "id": f"batch_req_{custom_id}",
+                    "custom_id": custom_id,
+                    "response": {
+                        "status_code": 200,
+                        "body": _chat_completion(completion, reply, usage),
+                    },
+                    "error": None,
+                }
+            )
+        with self.lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "created_at": int(time.time()),
+                "status": "completed",
+                "output_file_id": self._jsonl_file(outputs),
+                "error_file_id": self._jsonl_file(errors),
+                "request_counts": {
+                    "total": len(outputs) + len(errors),
+                    "completed": len(outputs),
+                    "failed": len(errors),
+                },
+            }
+            return self.batches[batch_id]
+
+    def _jsonl_file(self, records):
+        if not records:
+            return None
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = "".join(json.dumps(r) + "\n" for r in records).encode()
+        return file_id
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in the pipeline functions it wraps, per stage,
+    across all worker threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.prompt_bytes = 0
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.seconds[stage] += elapsed
+                    self.calls[stage] += 1
+
+        return timed
+
+    def instrument(self, module):
+        """
+        Replaces the stage functions of generate_docs with timed wrappers.
+        """
+        module.collect_folder = self.wrap("collect", module.collect_folder)
+        module.invoke_model = self.wrap("model", module.invoke_model)
+        module.parse_documentation = self.wrap("parse", module.parse_documentation)
+        module.write_documentation = self.wrap("write", module.write_documentation)
+        human_prompt = module.human_prompt
+
+        def measured_prompt(*args, **kwargs):
+            message = human_prompt(*args, **kwargs)
+            with self.lock:
+                self.prompt_bytes += len(message.content.encode("utf-8"))
+            return message
+
+        module.human_prompt = self.wrap("prompt", measured_prompt)
+
+    def report(self, folders):
+        return {
+            stage: {
+                "seconds": round(self.seconds[stage], 4),
+                "calls": self.calls[stage],
+                "per_folder_ms": round(1000 * self.seconds[stage] / max(folders, 1), 3),
+            }
+            for stage in STAGES
+        }
+
+
+def run_scenario(repo, concurrency, stream):
+    """
+    Documents a synthetic repository in this process and measures it.
+    The working directory receives the output/ folder.
+    :return: Dict of measurements
+    """
+    import generate_docs
+    from backends import create_backend
+    from ratelimit import RateLimiter
+
+    timer = StageTimer()
+    timer.instrument(generate_docs)
+    backend = create_backend("openai", "gpt-4o", timeout=120)
+    start = time.perf_counter()
+    results = generate_docs.process_repository(
+        repo,
+        concurrency,
+        None,
+        limiter=RateLimiter(),
+        backend=backend,
+        stall_timeout=60.0 if stream else None,
+    )
+    wall_time = time.perf_counter() - start
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    return {
+        "folders": len(results),
+        "statuses": statuses,
+        "files": sum(r.files for r in results),
+        "bytes": sum(r.bytes for r in results),
+        "wall_time": round(wall_time, 3),
+        "folders_per_minute": round(60 * len(results) / wall_time, 2),
+        "stages": timer.report(len(results)),
+        "prompt_bytes": timer.prompt_bytes,
+        "input_tokens": sum(r.input_tokens for r in results),
+        "output_tokens": sum(r.output_tokens for r in results),
+        "peak_memory_mb": round(peak_mb, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            [
+                "git",
+                "-C",
+                os.path.dirname(os.path.abspath(__file__)),
+                "rev-parse",
+                "HEAD",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Runs every requested scenario in its own process, so that peak memory and
+    module caches are not shared between scenarios.
+    """
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios {unknown}, expected {list(SCENARIOS)}")
+
+    results = []
+    with (
+        tempfile.TemporaryDirectory(prefix="docs-bench-") as workdir,
+        FakeModelServer(
+            args.ttft, args.tokens_per_second, args.output_tokens
+        ) as server,
+    ):
+        for name in scenarios:
+            folders, resources = SCENARIOS[name]
+            repo = os.path.join(workdir, f"repo-{name}")
+            synthetic_repo(repo, folders, resources, args.seed)
+            scenario_dir = os.path.join(workdir, f"run-{name}")
+            os.makedirs(scenario_dir)
+            print(f"Running scenario {name} ({folders} folders)...", file=sys.stderr)
+            env = {
+                **os.environ,
+                "OPENAI_API_KEY": "benchmark",
+                "OPENAI_BASE_URL": server.url,
+            }
+            worker = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "worker",
+                    repo,
+                    "--concurrency",
+                    str(args.concurrency),
+                ]
+                + (["--stream"] if args.stream else []),
+                cwd=scenario_dir,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            if worker.returncode != 0:
+                sys.stderr.write(worker.stderr)
+                raise SystemExit(f"Scenario {name} failed")
+            results.append({"scenario": name, **json.loads(worker.stdout)})
+
+    report = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "stream": args.stream,
+            "ttft": args.ttft,
+            "tokens_per_second": args.tokens_per_second,
+            "output_tokens": args.output_tokens,
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        print(
+            f"{result['scenario']:>6}: {result['folders']:5d} folders "
+            f"{result['wall_time']:8.2f}s {result['folders_per_minute']:9.1f} folders/min "
+            f"{result['prompt_bytes']:>11d} prompt bytes "
+            f"{result['peak_memory_mb']:7.1f} MB peak"
+        )
+    print(f"Results written to {args.output}")
+
+
+def compare(args):
+    """
+    Prints the relative change of the main metrics between two result files.
+    """
+    with open(args.before, "r", encoding="utf-8") as f:
+        before = {s["scenario"]: s for s in json.load(f)["scenarios"]}
+    with open(args.after, "r", encoding="utf-8") as f:
+        after = {s["scenario"]: s for s in json.load(f)["scenarios"]}
+    metrics = ("wall_time", "folders_per_minute", "prompt_bytes", "peak_memory_mb")
+    for name in sorted(before.keys() & after.keys()):
+        print(name)
+        for metric in metrics:
+            old, new = before[name][metric], after[name][metric]
+            change = f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+            print(f"  {metric:<20} {old:>12} -> {new:>12}  {change}")
+        for stage in STAGES:
+            old = before[name]["stages"][stage]["seconds"]
+            new = after[name]["stages"][stage]["seconds"]
+            change = f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+            print(f"  {stage + ' (s)':<20} {old:>12} -> {new:>12}  {change}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the documentation pipeline."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmark scenarios")
+    run_parser.add_argument(
+        "--scenarios",
+        default=DEFAULT_SCENARIOS,
+        help=f"Comma-separated scenarios among {', '.join(SCENARIOS)} "
+        "(default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="(default: %(default)s)",
+    )
+    run_parser.add_argument("--stream", action="store_true", help="Stream responses")
+    run_parser.add_argument(
+        "--ttft",
+        type=float,
+        default=DEFAULT_TTFT,
+        help="Server seconds before the first token (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=DEFAULT_TOKENS_PER_SECOND,
+        help="Server generation speed (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--output-tokens",
+        type=int,
+        default=DEFAULT_OUTPUT_TOKENS,
+        help="Tokens whose generation time the server simulates per response "
+        "(default: %(default)s)",
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="bench-results.json")
+
+    worker_parser = commands.add_parser("worker", help=argparse.SUPPRESS)
+    worker_parser.add_argument("repo")
+    worker_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    worker_parser.add_argument("--stream", action="store_true")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    elif args.command == "worker":
+        measurements = run_scenario(args.repo, args.concurrency, args.stream)
+        sys.stdout.write(json.dumps(measurements))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
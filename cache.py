@@ -0,0 +1,157 @@
+"""
+Persistent on-disk cache of generated documentation.
+Entries are keyed by a hash of the model name and the exact prompt sent to it,
+so a folder whose code and prompt templates are unchanged skips the LLM call.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+
+from atomic import write_atomic
+
+DEFAULT_CACHE_DIR = ".docs-cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def cache_key(model: str, messages) -> str:
+    """
+    Builds the cache key for a request.
+    :param model: Name of the model that answers the request
+    :param messages: Prompt messages; their content embeds the template text and the code
+    :return: Hex digest identifying the request
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    for message in messages:
+        digest.update(b"\0" + message.type.encode("utf-8") + b"\0")
+        digest.update(str(message.content).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Stores one JSON file per entry and evicts the least recently used
+    entries once the total size goes over `max_bytes`.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns the cached entry for `key`, or None on a miss.
+        :param key: Key built with cache_key
+        :return: Dict with `readme` and `diagram_code`
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The mtime doubles as the last access time used for eviction. The entry
+        # may have been evicted by another folder since it was read.
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return entry
+
+    def put(self, key, readme, diagram_code, **metadata):
+        """
+        Stores an entry atomically and evicts old entries if needed.
+        :param key: Key built with cache_key
+        :param readme: README.md content
+        :param diagram_code: generate_diagram.py content
+        :param metadata: Extra fields kept for inspection (folder, model...)
+        """
+        entry = {
+            "readme": readme,
+            "diagram_code": diagram_code,
+            "created": time.time(),
+            **metadata,
+        }
+        write_atomic(self._path(key), json.dumps(entry))
+        self.evict()
+
+    def entries(self):
+        """
+        Lists cache entries, most recently used first.
+        :return: List of (key, size in bytes, last access timestamp)
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.name[:-5], stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda e: e[2], reverse=True)
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        :return: Number of removed entries
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and total > self.max_bytes:
+            key, size, _ = entries.pop()
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def purge(self):
+        """
+        Removes every entry.
+        :return: Number of removed entries
+        """
+        entries = self.entries()
+        for key, _, _ in entries:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or purge the docs cache.")
+    parser.add_argument("command", choices=["list", "stats", "purge"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    cache = ResponseCache(args.cache_dir)
+    if args.command == "purge":
+        print(f"Removed {cache.purge()} entries from {args.cache_dir}")
+    elif args.command == "stats":
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(
+            f"{len(entries)} entries, {total / 1024 / 1024:.1f} MiB in {args.cache_dir}"
+        )
+    else:
+        for key, size, accessed in cache.entries():
+            with open(cache._path(key), "r", encoding="utf-8") as f:
+                folder = json.load(f).get("folder", "")
+            last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(accessed))
+            print(f"{key[:16]}  {size:>9}  {last_used}  {folder}")
+
+
+if __name__ == "__main__":
+    main()
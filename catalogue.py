@@ -0,0 +1,190 @@
+"""
+Catalogue of the AWS node classes supported by the installed `diagrams` package.
+The catalogue is built once by introspecting `diagrams.aws` and indexed by
+service category, so each prompt only lists the categories its code uses.
+"""
+
+import importlib
+import inspect
+import pkgutil
+import re
+from functools import cache
+
+# Categories listed for every folder: generic nodes (users, clients...) and
+# networking, which the diagram instructions rely on for VPC/subnet clusters.
+ALWAYS_INCLUDED = ("general", "network")
+
+# Service prefixes found in Terraform resource types (aws_<service>_...) and CDK
+# module names (aws_<service> / aws-<service>), mapped to `diagrams.aws` categories.
+SERVICE_CATEGORIES = {
+    "acm": ("security",),
+    "alb": ("network",),
+    "amplify": ("mobile",),
+    "api_gateway": ("network", "mobile"),
+    "apigateway": ("network", "mobile"),
+    "apigatewayv2": ("network", "mobile"),
+    "appautoscaling": ("compute",),
+    "applicationautoscaling": ("compute",),
+    "apprunner": ("compute",),
+    "appsync": ("integration", "mobile"),
+    "athena": ("analytics",),
+    "autoscaling": ("compute",),
+    "backup": ("storage",),
+    "batch": ("compute",),
+    "budgets": ("cost",),
+    "ce": ("cost",),
+    "certificatemanager": ("security",),
+    "cloudformation": ("management",),
+    "cloudfront": ("network",),
+    "cloudtrail": ("management",),
+    "cloudwatch_event": ("integration",),
+    "cloudwatch": ("management",),
+    "codeartifact": ("devtools",),
+    "codebuild": ("devtools",),
+    "codecommit": ("devtools",),
+    "codedeploy": ("devtools",),
+    "codepipeline": ("devtools",),
+    "cognito": ("security",),
+    "config": ("management",),
+    "customer_gateway": ("network",),
+    "db": ("database",),
+    "directory_service": ("security",),
+    "directconnect": ("network",),
+    "dms": ("migration",),
+    "docdb": ("database",),
+    "dx": ("network",),
+    "dynamodb": ("database",),
+    "ebs": ("storage",),
+    "ec2": ("compute",),
+    "ecr": ("compute",),
+    "ecs": ("compute",),
+    "efs": ("storage",),
+    "eip": ("compute",),
+    "eks": ("compute",),
+    "elastic_beanstalk": ("compute",),
+    "elasticache": ("database",),
+    "elasticbeanstalk": ("compute",),
+    "elasticloadbalancing": ("network",),
+    "elasticloadbalancingv2": ("network",),
+    "elasticsearch": ("analytics",),
+    "elb": ("network",),
+    "emr": ("analytics",),
+    "events": ("integration",),
+    "fsx": ("storage",),
+    "glacier": ("storage",),
+    "globalaccelerator": ("network",),
+    "glue": ("analytics",),
+    "guardduty": ("security",),
+    "iam": ("security",),
+    "instance": ("compute",),
+    "internet_gateway": ("network",),
+    "iot": ("iot",),
+    "kinesis": ("analytics",),
+    "kinesisfirehose": ("analytics",),
+    "kms": ("security",),
+    "lakeformation": ("analytics",),
+    "lambda": ("compute",),
+    "launch_configuration": ("compute",),
+    "launch_template": ("compute",),
+    "lb": ("network",),
+    "logs": ("management",),
+    "macie": ("security",),
+    "media": ("media",),
+    "memorydb": ("database",),
+    "mq": ("integration",),
+    "msk": ("analytics",),
+    "nat_gateway": ("network",),
+    "neptune": ("database",),
+    "network": ("network",),
+    "opensearch": ("analytics",),
+    "organizations": ("management",),
+    "pinpoint": ("engagement",),
+    "pipes": ("integration",),
+    "quicksight": ("analytics",),
+    "rds": ("database",),
+    "redshift": ("analytics",),
+    "route": ("network",),
+    "route53": ("network",),
+    "s3": ("storage",),
+    "sagemaker": ("ml",),
+    "scheduler": ("integration",),
+    "secretsmanager": ("security",),
+    "security_group": ("network",),
+    "securityhub": ("security",),
+    "ses": ("engagement",),
+    "sfn": ("integration",),
+    "shield": ("security",),
+    "sns": ("integration",),
+    "sqs": ("integration",),
+    "ssm": ("management",),
+    "stepfunctions": ("integration",),
+    "subnet": ("network",),
+    "timestream": ("database",),
+    "transfer": ("migration",),
+    "transit_gateway": ("network",),
+    "vpc": ("network",),
+    "vpn": ("network",),
+    "waf": ("security",),
+    "wafv2": ("security",),
+}
+
+AWS_IDENTIFIER = re.compile(r"\baws[_-]([a-z0-9]+(?:[_-][a-z0-9]+)*)")
+
+
+@cache
+def aws_catalogue():
+    """
+    Introspects the installed `diagrams.aws` package.
+    :return: Dict category -> sorted list of node class names, without aliases
+    """
+    import diagrams
+    import diagrams.aws
+
+    catalogue = {}
+    for module_info in pkgutil.iter_modules(diagrams.aws.__path__):
+        module = importlib.import_module(f"diagrams.aws.{module_info.name}")
+        names = sorted(
+            name
+            for name, obj in vars(module).items()
+            if inspect.isclass(obj)
+            and issubclass(obj, diagrams.Node)
+            and obj.__module__ == module.__name__
+            and obj.__name__ == name
+            and not name.startswith("_")
+        )
+        if names:
+            catalogue[module_info.name] = names
+    return catalogue
+
+
+def detect_categories(infrastructure_code: str):
+    """
+    Detects the `diagrams.aws` categories used by Terraform resource types and CDK modules.
+    :param infrastructure_code: Collected infrastructure code of a folder
+    :return: Set of category names, empty when no AWS service is recognised
+    """
+    categories = set()
+    for identifier in set(AWS_IDENTIFIER.findall(infrastructure_code.lower())):
+        identifier = identifier.replace("-", "_")
+        for prefix, prefix_categories in SERVICE_CATEGORIES.items():
+            if identifier == prefix or identifier.startswith(prefix + "_"):
+                categories.update(prefix_categories)
+    return categories
+
+
+def relevant_resources(infrastructure_code: str) -> str:
+    """
+    Lists the node classes relevant to a folder, one `diagrams.aws.<category>.<Class>` per line.
+    Falls back to the whole catalogue when no AWS service is recognised.
+    :param infrastructure_code: Collected infrastructure code of a folder
+    """
+    catalogue = aws_catalogue()
+    detected = detect_categories(infrastructure_code)
+    categories = (
+        sorted(detected.union(ALWAYS_INCLUDED)) if detected else sorted(catalogue)
+    )
+    return "\n".join(
+        f"diagrams.aws.{category}.{name}"
+        for category in categories
+        for name in catalogue.get(category, ())
+    )
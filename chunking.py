@@ -0,0 +1,140 @@
+"""
+Token-budgeted map-reduce for folders whose code does not fit in one request.
+The code is split along file and top-level block boundaries, each chunk is
+summarised in parallel (map) and the summaries are documented together (reduce).
+"""
+
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from collector import FILE_HEADER
+from promtps import chunk_prompt, chunk_system_prompt, reduce_prompt, system_prompt
+from tokens import count_tokens, response_usage
+
+DEFAULT_TOKEN_BUDGET = 90_000
+
+# A top-level block starts on an unindented line after a blank line: resources,
+# modules and variables in HCL, classes and functions in CDK code.
+BLOCK_START = re.compile(r"\n\n(?=[^\s}\])])")
+
+logger = logging.getLogger(__name__)
+
+
+def _split_files(infrastructure_code):
+    pieces = infrastructure_code.split("\n" + FILE_HEADER)
+    return [pieces[0]] + [FILE_HEADER + piece for piece in pieces[1:]]
+
+
+def _split_lines(text, budget, model):
+    piece, pieces, tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = count_tokens(line, model)
+        if piece and tokens + line_tokens > budget:
+            pieces.append("".join(piece))
+            piece, tokens = [], 0
+        piece.append(line)
+        tokens += line_tokens
+    if piece:
+        pieces.append("".join(piece))
+    return pieces
+
+
+def _split_file(file_code, budget, model):
+    header, _, body = file_code.partition("\n")
+    if not header.startswith(FILE_HEADER):
+        header, body = "", file_code
+    pieces = []
+    for block in BLOCK_START.split(body):
+        if count_tokens(block, model) > budget:
+            pieces.extend(_split_lines(block, budget, model))
+        else:
+            pieces.append(block)
+    if header:
+        # Every piece keeps the file it comes from, so chunks stay self-describing.
+        pieces = [f"{header}\n{piece}" for piece in pieces]
+    return pieces
+
+
+def split_code(infrastructure_code, budget, model="gpt-4o"):
+    """
+    Splits collected code into chunks of at most `budget` tokens.
+    Files are kept whole when they fit; larger files are split between
+    top-level blocks, and blocks that still do not fit between lines.
+    :param infrastructure_code: Code collected by FileCollector
+    :param budget: Maximum number of tokens per chunk
+    :param model: Model whose tokenizer is used
+    :return: List of chunks
+    """
+    pieces = []
+    for file_code in _split_files(infrastructure_code):
+        if not file_code.strip():
+            continue
+        if count_tokens(file_code, model) > budget:
+            pieces.extend(_split_file(file_code, budget, model))
+        else:
+            pieces.append(file_code)
+
+    chunks, chunk, tokens = [], [], 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece, model)
+        if chunk and tokens + piece_tokens > budget:
+            chunks.append("\n".join(chunk))
+            chunk, tokens = [], 0
+        chunk.append(piece)
+        tokens += piece_tokens
+    if chunk:
+        chunks.append("\n".join(chunk))
+    return chunks
+
+
+def summarise_chunks(
+    invoke, model, infra_folder, infrastructure_code, budget, concurrency
+):
+    """
+    Summarises the chunks of an oversized folder in parallel (map) and builds the
+    request documenting the folder from the summaries (reduce).
+    :param invoke: Callable sending a list of messages to the model and returning
+        its response
+    :param model: Model name used for token counting
+    :param infra_folder: Folder where the infrastructure code is located
+    :param infrastructure_code: Code collected for the folder
+    :param budget: Maximum number of code tokens per request
+    :param concurrency: Maximum number of chunks summarised at the same time
+    :return: Tuple (reduce messages, (input_tokens, output_tokens, cached_tokens)
+        of the map phase)
+    """
+    chunks = split_code(infrastructure_code, budget, model)
+    logger.info(
+        "Code for %s is over %d tokens, summarising %d chunks",
+        infra_folder,
+        budget,
+        len(chunks),
+    )
+    requests = [
+        [chunk_system_prompt(), chunk_prompt(chunk, infra_folder, index, len(chunks))]
+        for index, chunk in enumerate(chunks, 1)
+    ]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        summaries = list(executor.map(invoke, requests))
+
+    usage = [0, 0, 0]
+    for request, reply in zip(requests, summaries, strict=True):
+        for i, value in enumerate(response_usage(reply, request, model)):
+            usage[i] += value
+    messages = [
+        system_prompt(),
+        reduce_prompt(
+            [summary.content for summary in summaries],
+            infrastructure_code,
+            infra_folder,
+        ),
+    ]
+    return messages, tuple(usage)
+
+
+def fits_budget(infrastructure_code, budget, model="gpt-4o"):
+    """
+    :return: True when the code can be sent in a single request
+    """
+    return not budget or count_tokens(infrastructure_code, model) <= budget
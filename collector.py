@@ -0,0 +1,281 @@
+"""
+Single-pass collection of Terraform (.tf) and CDK (.ts, .py) files.
+Vendored and generated directories are pruned, `.gitignore` and the docs ignore
+file are honoured, and binary or oversized files are skipped.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+
+INFRA_EXTENSIONS = (".tf", ".ts", ".py")
+
+DEFAULT_IGNORE_FILE = ".docsignore"
+DEFAULT_MAX_FILE_BYTES = 512 * 1024
+
+# Directories that never contain infrastructure code worth documenting.
+PRUNED_DIRECTORIES = {
+    ".git",
+    ".terraform",
+    ".terragrunt-cache",
+    ".venv",
+    "__pycache__",
+    "cdk.out",
+    "node_modules",
+    "venv",
+}
+
+BINARY_SNIFF_BYTES = 8192
+
+# Precedes each file in the collected code; chunking splits on it.
+FILE_HEADER = "# File: "
+
+
+def _translate(pattern: str) -> str:
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class IgnoreRules:
+    """
+    Patterns of one ignore file, with `.gitignore` syntax, relative to `base`.
+    """
+
+    def __init__(self, base: str, lines):
+        self.base = base
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            anchored = "/" in line
+            line = line.lstrip("/")
+            regex = _translate(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(f"^{regex}$"), negated, dir_only))
+
+    @classmethod
+    def load(cls, directory: str, filename: str):
+        """
+        Loads `filename` from `directory`, or returns None when it does not exist.
+        """
+        path = os.path.join(directory, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(directory, f.readlines())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def match(self, path: str, is_dir: bool):
+        """
+        :return: True if ignored, False if re-included by a negation, None if no rule applies
+        """
+        relative = os.path.relpath(path, self.base).replace(os.sep, "/")
+        if relative.startswith("../"):
+            return None
+        decision = None
+        for regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative):
+                decision = not negated
+        return decision
+
+
+def _is_ignored(path, is_dir, rules):
+    ignored = False
+    for rule in rules:
+        decision = rule.match(path, is_dir)
+        if decision is not None:
+            ignored = decision
+    return ignored
+
+
+@dataclass
+class CollectionStats:
+    """
+    Files and bytes included in, or skipped from, a folder's collected code.
+    """
+
+    files: int = 0
+    bytes: int = 0
+    skipped_files: int = 0
+    skipped_bytes: int = 0
+    pruned_dirs: int = 0
+    skipped: dict = field(default_factory=dict)
+
+    def skip(self, reason: str, size: int):
+        self.skipped_files += 1
+        self.skipped_bytes += size
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+
+class FileCollector:
+    """
+    Walks a folder once with `os.scandir` and yields its infrastructure files.
+    :param ignore_file: Name of the docs ignore file honoured like `.gitignore`
+    :param max_file_bytes: Files larger than this are skipped
+    :param boundaries: Directories never entered from a folder above them, such
+        as nested stack roots documented on their own
+    """
+
+    def __init__(
+        self,
+        ignore_file=DEFAULT_IGNORE_FILE,
+        max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+        extensions=INFRA_EXTENSIONS,
+        boundaries=(),
+    ):
+        self.ignore_files = (".gitignore", ignore_file)
+        self.max_file_bytes = max_file_bytes
+        self.extensions = extensions
+        self.boundaries = {os.path.abspath(path) for path in boundaries}
+
+    def _ancestor_rules(self, directory):
+        # Ignore files above the folder apply too, up to the root of its git checkout.
+        ancestors = []
+        current = os.path.dirname(os.path.abspath(directory))
+        while True:
+            ancestors.append(current)
+            if os.path.isdir(os.path.join(current, ".git")):
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                return []
+            current = parent
+        return [
+            rules
+            for ancestor in reversed(ancestors)
+            for name in self.ignore_files
+            if (rules := IgnoreRules.load(ancestor, name)) is not None
+        ]
+
+    def walk(self, directory, stats=None, exclude=()):
+        """
+        Walks a folder in a stable order, pruning vendored, generated, ignored
+        and excluded directories, and the boundaries of the collector.
+        :param directory: Folder to walk
+        :param stats: CollectionStats counting the pruned directories
+        :param exclude: Subdirectories not to enter
+        :return: Generator of (directory, ignore rules applying to it, sorted
+            file entries)
+        """
+        stats = stats if stats is not None else CollectionStats()
+        root = os.path.abspath(directory)
+        excluded = {os.path.abspath(path) for path in exclude} | self.boundaries
+        stack = [(root, self._ancestor_rules(root))]
+        while stack:
+            current, inherited = stack.pop()
+            rules = inherited + [
+                rules
+                for name in self.ignore_files
+                if (rules := IgnoreRules.load(current, name)) is not None
+            ]
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+
+            subdirectories, files = [], []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if (
+                        entry.name in PRUNED_DIRECTORIES
+                        or entry.path in excluded
+                        or os.path.exists(os.path.join(entry.path, "pyvenv.cfg"))
+                        or _is_ignored(entry.path, True, rules)
+                    ):
+                        stats.pruned_dirs += 1
+                        continue
+                    subdirectories.append((entry.path, rules))
+                elif entry.is_file():
+                    files.append(entry)
+            yield current, rules, files
+            # Reversed so the stack pops subdirectories in name order.
+            stack.extend(reversed(subdirectories))
+
+    def iter_files(self, directory, stats=None, exclude=()):
+        """
+        Yields the infrastructure files of a folder in a stable order.
+        :param directory: Folder to walk
+        :param stats: CollectionStats updated as files are included or skipped
+        :param exclude: Subdirectories not to enter, e.g. local modules described
+            separately
+        :return: Generator of (path relative to directory, file content)
+        """
+        stats = stats if stats is not None else CollectionStats()
+        root = os.path.abspath(directory)
+        for _, rules, files in self.walk(root, stats, exclude):
+            for entry in files:
+                if entry.name.endswith(self.extensions):
+                    content = self._read(entry, rules, stats)
+                    if content is not None:
+                        yield os.path.relpath(entry.path, root), content
+
+    def _read(self, entry, rules, stats):
+        size = entry.stat().st_size
+        if _is_ignored(entry.path, False, rules):
+            stats.skip("ignored", size)
+            return None
+        if size > self.max_file_bytes:
+            stats.skip("oversized", size)
+            return None
+        try:
+            with open(entry.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            stats.skip("unreadable", size)
+            return None
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            stats.skip("binary", size)
+            return None
+        try:
+            content = data.decode("utf-8")
+        except UnicodeDecodeError:
+            stats.skip("binary", size)
+            return None
+        stats.files += 1
+        stats.bytes += size
+        return content
+
+    def collect(self, directory, exclude=()):
+        """
+        Joins the infrastructure files of a folder, each preceded by its path.
+        :param directory: Folder to collect
+        :param exclude: Subdirectories not to collect
+        :return: Tuple (infrastructure code, CollectionStats)
+        """
+        stats = CollectionStats()
+        code = "".join(
+            f"{FILE_HEADER}{path}\n{content}\n\n"
+            for path, content in self.iter_files(directory, stats, exclude)
+        )
+        return code, stats
@@ -0,0 +1,69 @@
+"""
+Static validation of generated generate_diagram.py files.
+Imports from `diagrams` are checked against an index of the installed package
+without running the script, so invalid node classes are caught before rendering.
+"""
+
+import ast
+import difflib
+import importlib
+import pkgutil
+from functools import cache
+
+
+@cache
+def diagrams_index():
+    """
+    Indexes the installed `diagrams` package.
+    :return: Dict module name -> frozenset of its public names, aliases included
+    """
+    import diagrams
+
+    index = {"diagrams": frozenset(n for n in vars(diagrams) if not n.startswith("_"))}
+    for module_info in pkgutil.walk_packages(diagrams.__path__, "diagrams."):
+        module = importlib.import_module(module_info.name)
+        index[module_info.name] = frozenset(
+            name for name in vars(module) if not name.startswith("_")
+        )
+    return index
+
+
+def _unknown_name(module, name, exports):
+    suggestions = difflib.get_close_matches(name, exports, n=3)
+    hint = f" (did you mean {', '.join(suggestions)}?)" if suggestions else ""
+    return f"`{name}` does not exist in `{module}`{hint}"
+
+
+def validate_diagram(diagram_code: str):
+    """
+    Checks the syntax of a diagram script and its imports from `diagrams`.
+    :param diagram_code: Content of generate_diagram.py
+    :return: List of error messages, empty when the script is valid
+    """
+    try:
+        tree = ast.parse(diagram_code)
+    except SyntaxError as e:
+        return [f"SyntaxError on line {e.lineno}: {e.msg}"]
+
+    index = diagrams_index()
+    errors = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] == "diagrams" and alias.name not in index:
+                    errors.append(f"module `{alias.name}` does not exist")
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            module = node.module or ""
+            if module.split(".")[0] != "diagrams":
+                continue
+            if module not in index:
+                errors.append(f"module `{module}` does not exist")
+                continue
+            for alias in node.names:
+                if (
+                    alias.name != "*"
+                    and alias.name not in index[module]
+                    and f"{module}.{alias.name}" not in index
+                ):
+                    errors.append(_unknown_name(module, alias.name, index[module]))
+    return errors
@@ -0,0 +1,58 @@
+"""
+Deterministic chat model of the fake backend, answering from the prompt alone
+with configurable latency for offline runs and benchmarks.
+"""
+
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from backends import fake_reply, fake_usage
+
+FAKE_CHUNK_CHARS = 16
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model answering from the prompt alone, without network.
+    Documentation requests get a JSON object with a README listing the Terraform
+    blocks of the prompt and a valid diagram; other requests get a short summary.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _reply(self, messages):
+        return fake_reply(str(messages[-1].content))
+
+    def _usage(self, messages, text):
+        return fake_usage("".join(str(m.content) for m in messages), text)
+
+    def _token_delay(self, text):
+        return len(text) / 4 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self.latency + self._token_delay(text))
+        message = AIMessage(text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self.latency)
+        for i in range(0, len(text), FAKE_CHUNK_CHARS):
+            piece = text[i : i + FAKE_CHUNK_CHARS]
+            time.sleep(self._token_delay(piece))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="", usage_metadata=self._usage(messages, text)
+            )
+        )
@@ -3,132 +3,1811 @@ Generate documentation for AWS infrastructure code.
 It script reads all Terraform (.tf) and CDK (.ts, .py) files in the given directory.
 """
 
-import glob
+import argparse
+import asyncio
+import contextvars
 import logging
 import os
-import re
-import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cache, partial
 
-from dotenv import load_dotenv
-from github import Github
-from langchain_openai import ChatOpenAI
-
-from promtps import human_prompt, system_prompt
+from backends import BACKENDS, DEFAULT_OLLAMA_URL, Backend, create_backend
+from batch import (
+    DEFAULT_POLL_INTERVAL,
+    batch_request,
+    fetch_results,
+    submit_batch,
+    wait_for_batch,
+    write_batch_file,
+)
+from cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ResponseCache, cache_key
+from chunking import DEFAULT_TOKEN_BUDGET, fits_budget, summarise_chunks
+from collector import DEFAULT_IGNORE_FILE, DEFAULT_MAX_FILE_BYTES, FileCollector
+from diagram_check import validate_diagram
+from incremental import changed_folders
+from manifest import DEFAULT_MANIFEST, RunManifest, input_hash
+from modules import ModuleRegistry, local_modules
+from parsing import MalformedResponse, parse_diagram_code, parse_documentation
+from promtps import human_prompt, repair_prompt, system_prompt, variant_prompt
+from ratelimit import DEFAULT_MAX_RETRIES, RateLimiter
+from remote import (
+    DEFAULT_ARCHIVE_THRESHOLD,
+    DEFAULT_GITHUB_URL,
+    DEFAULT_REMOTE_DIR,
+    fetch_repositories,
+)
+from render import DEFAULT_RENDER_TIMEOUT, render_diagrams
+from sharding import assign_shards, parse_shard, shard_manifest_path
+from similarity import DEFAULT_VARIANT_THRESHOLD, cluster_sketches, code_diff, sketch
+from stacks import STACK_INDEX_FILE, discover_stacks
+from streaming import DEFAULT_STALL_TIMEOUT, DocumentationStream
+from tf_graph import graph_payload
+from tokens import count_tokens, estimate_tokens, messages_tokens, response_usage
+from tracing import in_context, span, tracer
 
 # from langchain_openai import ChatOpenAI
 
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_MAX_REPAIRS = 2
+DEFAULT_MAX_PARSE_RETRIES = 2
+DEFAULT_SMALL_TOKENS = 4000
+# A variant is documented in full when its diff and the base documentation are
+# more than this fraction of its code.
+VARIANT_MAX_RATIO = 0.75
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
 
+# Backend used when none is passed explicitly, set from the command line.
+default_backend: Backend | None = None
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set")
 
-github_client = Github(os.getenv("GITHUB_TOKEN"))
+def get_backend() -> Backend:
+    """
+    :return: The default backend, OpenAI gpt-4o unless another one was configured
+    """
+    global default_backend
+    if default_backend is None:
+        default_backend = create_backend("openai", timeout=DEFAULT_TIMEOUT)
+    return default_backend
 
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+@cache
+def get_github_client(base_url=DEFAULT_GITHUB_URL):
+    """
+    :param base_url: GitHub API URL, e.g. of GitHub Enterprise or a stand-in server
+    :return: GitHub client authenticated with GITHUB_TOKEN, built on first use
+    """
+    from github import Auth, Github
+
+    token = os.getenv("GITHUB_TOKEN")
+    # Lazy objects are not fetched until an attribute needs them, which saves
+    # one request per repository.
+    return Github(
+        auth=Auth.Token(token) if token else None, base_url=base_url, lazy=True
+    )
+
+
+def extract_infrastructure_code(directory, collector=None, exclude=()):
+    """
+    Reads all Terraform (.tf) and CDK (.ts, .py) files in the given directory.
+    :param directory: Folder to read
+    :param collector: FileCollector with the ignore rules and size limits to apply
+    :param exclude: Subdirectories not to read
+    :return: Tuple (infrastructure code, CollectionStats)
+    """
+    collector = collector or FileCollector()
+    return collector.collect(directory, exclude)
+
+
+@dataclass
+class FolderResult:
+    """
+    Outcome of documenting a single infrastructure folder.
+    `saved_tokens` estimates the input tokens a second copy of the code would have cost.
+    `cached_tokens` is the part of `input_tokens` served from the provider's prompt cache.
+    `variant_of` is the folder a variant was documented from, as a diff, and
+    `variant_saved_tokens` the input tokens this saved against sending its code.
+    """
+
+    folder: str
+    status: str
+    duration: float = 0.0
+    error: str | None = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    saved_tokens: int = 0
+    cached_tokens: int = 0
+    files: int = 0
+    bytes: int = 0
+    skipped_files: int = 0
+    skipped_bytes: int = 0
+    retries: int = 0
+    throttled: float = 0.0
+    repairs: int = 0
+    input_hash: str | None = None
+    first_token: float | None = None
+    tokens_per_second: float = 0.0
+    model: str | None = None
+    variant_of: str | None = None
+    variant_saved_tokens: int = 0
 
-logger = logging.getLogger(__name__)
-logger.info("Loading OpenAI")
-llm = ChatOpenAI(model="gpt-4o")
-# llm = ChatOllama(model="llama3:latest", base_url="http://localhost:11434")
+
+class FolderCancelled(Exception):
+    """
+    Raised in the worker thread of a folder that timed out, so the abandoned
+    call stops before calling the model again or writing output and cache.
+    """
 
 
-def remove_code_blocks(text, block_code):
+# Set by the worker of each folder to the event flagging it as abandoned.
+_cancelled = contextvars.ContextVar("cancelled", default=None)
+
+
+def check_cancelled(infra_folder: str):
+    """
+    :raises FolderCancelled: When the folder being documented has timed out
     """
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise FolderCancelled(f"{infra_folder} timed out, its output is discarded")
 
-    Args:
-        text (_type_): _description_
+
+def write_documentation(infra_folder: str, readme_content: str, diagram_code: str):
+    """
+    Writes README.md and generate_diagram.py for a folder under output/.
     """
-    if block_code == "python":
-        return re.sub(
-            r"^```python\n",
-            "",
-            re.sub(r"```$", "", text, flags=re.MULTILINE),
-            flags=re.MULTILINE,
+    with span(
+        "write",
+        folder=infra_folder,
+        bytes=len(readme_content.encode()) + len(diagram_code.encode()),
+    ):
+        os.makedirs(f"output/{infra_folder}/", exist_ok=True)
+
+        with open(f"output/{infra_folder}/README.md", "w", encoding="utf-8") as f:
+            f.write(readme_content)
+
+        with open(
+            f"output/{infra_folder}/generate_diagram.py", "w", encoding="utf-8"
+        ) as f:
+            f.write(diagram_code)
+
+
+def read_documentation(infra_folder: str):
+    """
+    Reads back the README.md and generate_diagram.py written for a folder.
+    :return: Tuple (readme_content, diagram_code), None when they are missing
+    """
+    try:
+        with open(f"output/{infra_folder}/README.md", "r", encoding="utf-8") as f:
+            readme_content = f.read()
+        with open(
+            f"output/{infra_folder}/generate_diagram.py", "r", encoding="utf-8"
+        ) as f:
+            return readme_content, f.read()
+    except OSError:
+        return None
+
+
+def invoke_model(
+    messages,
+    infra_folder: str,
+    limiter: RateLimiter | None = None,
+    structured: bool = False,
+    stream: DocumentationStream | None = None,
+    backend: Backend | None = None,
+):
+    """
+    Sends messages to the model, through the shared rate limiter when given.
+    :param messages: Prompt messages
+    :param infra_folder: Folder the call is accounted to
+    :param limiter: RateLimiter shared by the run, None to call the model directly
+    :param structured: Constrain the response to a JSON object
+    :param stream: DocumentationStream consuming the response as it is generated,
+        None to wait for the whole response
+    :param backend: Backend answering the request, the default backend when None
+    :return: Model response
+    """
+    check_cancelled(infra_folder)
+    backend = backend or get_backend()
+    model = backend.structured() if structured else backend.llm
+    attempts = 0
+
+    def call():
+        nonlocal attempts
+        attempts += 1
+        if stream is None:
+            return model.invoke(messages)
+        return stream.consume(model.stream(messages))
+
+    with span(
+        "model",
+        folder=infra_folder,
+        backend=backend.name,
+        model=backend.model,
+        structured=structured,
+        stream=stream is not None,
+    ) as model_span:
+        try:
+            if limiter is None:
+                response = call()
+            else:
+                response = limiter.call(
+                    call,
+                    messages_tokens(messages, backend.model),
+                    infra_folder,
+                    lambda response: sum(
+                        response_usage(response, messages, backend.model)[:2]
+                    ),
+                )
+        finally:
+            model_span.set(retries=max(attempts - 1, 0))
+        input_tokens, output_tokens, cached_tokens = response_usage(
+            response, messages, backend.model
         )
-    elif block_code == "markdown":
-        return re.sub(
-            r"^```markdown\n",
-            "",
-            re.sub(r"```$", "", text, flags=re.MULTILINE),
-            flags=re.MULTILINE,
+        model_span.set(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_tokens=cached_tokens,
+            first_token=stream.first_token if stream else None,
         )
+        return response
 
 
-def extract_infrastructure_code(directory):
+def request_documentation(
+    invoke, model, messages, infra_folder, max_parse_retries, stream=None
+):
     """
-    Reads all Terraform (.tf) and CDK (.ts, .py) files in the given directory.
+    Requests the README and the diagram as a JSON object, asking again when the
+    response cannot be parsed.
+    :param invoke: Callable sending a list of messages to the model
+    :param model: Model name used for token counting
+    :param messages: Prompt messages
+    :param max_parse_retries: Requests repeated after a malformed response
+    :param stream: DocumentationStream writing the response as it arrives, None
+        to wait for the whole response
+    :return: Tuple (readme_content, diagram_code,
+        (input_tokens, output_tokens, cached_tokens) of every attempt)
+    :raises MalformedResponse: When the last attempt is still malformed
     """
-    infrastructure_code = ""
+    usage = [0, 0, 0]
+    attempt = 0
+    while True:
+        response = invoke(messages, structured=True, stream=stream)
+        for i, value in enumerate(response_usage(response, messages, model)):
+            usage[i] += value
+        try:
+            with span("parse", folder=infra_folder, attempt=attempt):
+                readme_content, diagram_code = parse_documentation(response.content)
+        except MalformedResponse as e:
+            if attempt == max_parse_retries:
+                raise
+            attempt += 1
+            logger.warning(
+                "Malformed response for %s, asking again (%d/%d): %s",
+                infra_folder,
+                attempt,
+                max_parse_retries,
+                e,
+            )
+            continue
+        return readme_content, diagram_code, tuple(usage)
 
-    for file in (
-        glob.glob(f"{directory}/**/*.tf", recursive=True)
-        + glob.glob(f"{directory}/**/*.ts", recursive=True)
-        + glob.glob(f"{directory}/**/*.py", recursive=True)
-    ):
-        with open(file, "r", encoding="utf-8") as f:
-            infrastructure_code += f.read() + "\n\n"
 
-    return infrastructure_code
+def repair_diagram(
+    invoke, model, diagram_code, infrastructure_code, infra_folder, max_repairs
+):
+    """
+    Validates the diagram code and sends only the diagram back to the model, with
+    the errors found, until it is valid or `max_repairs` calls were made.
+    :param invoke: Callable sending a list of messages to the model
+    :param model: Model name used for token counting
+    :return: Tuple (diagram_code, (input_tokens, output_tokens, cached_tokens),
+        repairs made, remaining errors)
+    """
+    usage = [0, 0, 0]
+    with span("validate", folder=infra_folder) as validate_span:
+        errors = validate_diagram(diagram_code)
+        validate_span.set(errors=len(errors))
+    repairs = 0
+    while errors and repairs < max_repairs:
+        logger.info(
+            "Diagram for %s is invalid, repairing: %s", infra_folder, "; ".join(errors)
+        )
+        messages = [
+            system_prompt(),
+            repair_prompt(diagram_code, errors, infrastructure_code, infra_folder),
+        ]
+        with span("repair", folder=infra_folder, attempt=repairs) as repair_span:
+            response = invoke(messages, structured=True)
+            for i, value in enumerate(response_usage(response, messages, model)):
+                usage[i] += value
+            diagram_code = parse_diagram_code(response.content)
+            errors = validate_diagram(diagram_code)
+            repair_span.set(errors=len(errors))
+        repairs += 1
+    if errors:
+        logger.warning(
+            "Diagram for %s is still invalid after %d repairs: %s",
+            infra_folder,
+            repairs,
+            "; ".join(errors),
+        )
+    return diagram_code, tuple(usage), repairs, errors
 
 
-def geneate_documentation(infra_folder: str, infrastructure_code: str):
+def geneate_documentation(
+    infra_folder: str,
+    infrastructure_code: str,
+    cache: ResponseCache | None = None,
+    token_budget: int | None = DEFAULT_TOKEN_BUDGET,
+    map_concurrency: int = DEFAULT_CONCURRENCY,
+    limiter: RateLimiter | None = None,
+    max_repairs: int = DEFAULT_MAX_REPAIRS,
+    max_parse_retries: int = DEFAULT_MAX_PARSE_RETRIES,
+    stall_timeout: float | None = None,
+    backend: Backend | None = None,
+    variant: tuple | None = None,
+):
     """
     Generate documentation for a given infrastructure code
-    :param repo_name: Name of the repository
     :param infra_folder: Folder where the infrastructure code is located
     :param infraescture_code: Infrastructure code
-    :return: Documentation for the given infrastructure code
+    :param cache: Response cache consulted before calling the model, None to disable
+    :param token_budget: Code tokens above which the folder is documented from
+        summaries of its chunks, None to always send the code at once
+    :param map_concurrency: Maximum number of chunks summarised at the same time
+    :param limiter: RateLimiter shared by the run, None to call the model directly
+    :param max_repairs: Calls allowed to fix a diagram that fails validation
+    :param max_parse_retries: Requests repeated after a malformed response
+    :param stall_timeout: Stream the response to the output files, aborting it
+        when no token arrives for this many seconds; None to wait for the whole
+        response
+    :param backend: Backend documenting the folder, the default backend when None
+    :param variant: Tuple (base folder, base README, base diagram code, diff) to
+        document the folder from the documentation of a near-identical folder and
+        the diff of their code, None to send the whole code
+    :return: FolderResult with status "cached" or "done" and the token usage
     """
+    backend = backend or get_backend()
+    model = backend.model
 
-    messages = [
-        system_prompt(infrastructure_code, infra_folder),
-        human_prompt(infrastructure_code, infra_folder),
-    ]
+    with span("prompt", folder=infra_folder, variant=bool(variant)) as prompt_span:
+        messages = [
+            system_prompt(),
+            variant_prompt(infrastructure_code, infra_folder, *variant)
+            if variant
+            else human_prompt(infrastructure_code, infra_folder),
+        ]
+        prompt_span.set(
+            bytes=sum(len(message.content.encode()) for message in messages)
+        )
 
-    response = llm.invoke(messages)
-    os.makedirs(f"output/{infra_folder}/", exist_ok=True)
+    with span("cache", folder=infra_folder, enabled=cache is not None) as cache_span:
+        key = cache_key(model, messages) if cache else None
+        cached = cache.get(key) if cache else None
+        cache_span.set(hit=bool(cached))
+    if cached:
+        check_cancelled(infra_folder)
+        write_documentation(infra_folder, cached["readme"], cached["diagram_code"])
+        logger.info("Documentation for %s restored from cache", infra_folder)
+        return FolderResult(infra_folder, "cached")
 
-    readme_content, diagram_code = response.content.split("```python", 1)
-    diagram_code = "```python" + diagram_code.split("```")[0] + "```"
+    invoke = partial(
+        invoke_model, infra_folder=infra_folder, limiter=limiter, backend=backend
+    )
+    map_usage = (0, 0, 0)
+    if not variant and not fits_budget(infrastructure_code, token_budget, model):
+        with span("map", folder=infra_folder):
+            messages, map_usage = summarise_chunks(
+                # Chunks are summarised in other threads, under this span.
+                in_context(invoke),
+                model,
+                infra_folder,
+                infrastructure_code,
+                token_budget,
+                map_concurrency,
+            )
+    stream = (
+        DocumentationStream(infra_folder, stall_timeout, _cancelled.get(), model)
+        if stall_timeout
+        else None
+    )
+    readme_content, diagram_code, usage = request_documentation(
+        invoke, model, messages, infra_folder, max_parse_retries, stream
+    )
+    diagram_code, repair_usage, repairs, errors = repair_diagram(
+        invoke, model, diagram_code, infrastructure_code, infra_folder, max_repairs
+    )
+    input_tokens, output_tokens, cached_tokens = (
+        sum(values) for values in zip(map_usage, usage, repair_usage, strict=True)
+    )
+    check_cancelled(infra_folder)
+    write_documentation(infra_folder, readme_content, diagram_code)
+    # Invalid diagrams are not cached, so the next run generates them again.
+    if cache and not errors:
+        cache.put(key, readme_content, diagram_code, folder=infra_folder, model=model)
 
-    readme_content = remove_code_blocks(readme_content, "markdown")
-    diagram_code = remove_code_blocks(diagram_code, "python")
+    logger.info(
+        "Documentation for %s generated successfully with %s", infra_folder, model
+    )
+    return FolderResult(
+        infra_folder,
+        "done",
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cached_tokens=cached_tokens,
+        saved_tokens=count_tokens(infrastructure_code, model),
+        repairs=repairs,
+        error="; ".join(errors) or None,
+        first_token=stream.first_token if stream else None,
+        tokens_per_second=stream.tokens_per_second if stream else 0.0,
+        model=model,
+    )
 
-    readme_content.replace("# generate_diagram.py", "")
 
-    with open(f"output/{infra_folder}/README.md", "w", encoding="utf-8") as f:
-        f.write(readme_content.strip())
+def list_infrastructure_folders(base_directory):
+    """
+    Lists the infrastructure folders of a repository in a stable order.
+    :param base_directory: Base directory where the repository is located
+    """
+    return sorted(
+        d
+        for d in os.listdir(base_directory)
+        if os.path.isdir(os.path.join(base_directory, d))
+    )
 
-    with open(f"output/{infra_folder}/generate_diagram.py", "w", encoding="utf-8") as f:
-        f.write(diagram_code.strip())
 
-    logger.info("Documentation for %s generated successfully", infra_folder)
+def collect_folder(
+    base_directory, infra_folder, collector=None, payload="code", exclude=()
+):
+    """
+    Collects the prompt payload of a folder.
+    :param payload: "code" for the files verbatim, "graph" for the Terraform resource graph
+    :param exclude: Subdirectories not to collect
+    :return: Tuple (infrastructure code, CollectionStats)
+    """
+    infra_path = os.path.join(base_directory, infra_folder)
+    with span("collect", folder=infra_folder, payload=payload) as collect_span:
+        if payload == "graph":
+            infrastructure_code, stats = graph_payload(infra_path, collector, exclude)
+        else:
+            infrastructure_code, stats = extract_infrastructure_code(
+                infra_path, collector, exclude
+            )
+        collect_span.set(
+            files=stats.files,
+            bytes=stats.bytes,
+            skipped_files=stats.skipped_files,
+            skipped_bytes=stats.skipped_bytes,
+        )
+    return infrastructure_code, stats
 
 
-def process_repository(base_directory):
+def variant_payload(infra_folder, infrastructure_code, base_folder, base_code, model):
     """
-    Processes each infrastructure folder separately.
-    :param base_directory: Base directory where the repository is located
+    Prepares documenting a folder from the documentation of a near-identical
+    folder and the diff of their code.
+    :param base_code: Code collected for base_folder
+    :return: Tuple (variant argument of geneate_documentation, input tokens saved);
+        (None, 0) when base_folder has no documentation or the diff and the base
+        documentation are not much smaller than the code
     """
+    documentation = read_documentation(base_folder)
+    if documentation is None:
+        logger.info(
+            "%s has no documentation, documenting %s in full", base_folder, infra_folder
+        )
+        return None, 0
+    diff = code_diff(base_code, infrastructure_code, base_folder, infra_folder)
+    sent = count_tokens(diff + "".join(documentation), model)
+    full = count_tokens(infrastructure_code, model)
+    if sent > full * VARIANT_MAX_RATIO:
+        logger.info(
+            "Diff of %s against %s is too large, documenting it in full",
+            infra_folder,
+            base_folder,
+        )
+        return None, 0
+    return (base_folder, *documentation, diff), full - sent
+
+
+def collect_for_documentation(
+    base_directory, infra_folder, collector=None, payload="code", module_registry=None
+):
+    """
+    Collects a folder as it is documented: without the local modules inside it
+    when they are described separately.
+    :return: Tuple (infrastructure code, CollectionStats, local module directories)
+    """
+    infra_path = os.path.join(base_directory, infra_folder)
+    modules = local_modules(infra_path, collector) if module_registry else []
+    infrastructure_code, stats = collect_folder(
+        base_directory,
+        infra_folder,
+        collector,
+        payload,
+        exclude=[
+            module
+            for module in modules
+            if module.startswith(os.path.abspath(infra_path) + os.sep)
+        ],
+    )
+    return infrastructure_code, stats, modules
 
-    infrastructure_folders = [
-        d
-        for d in os.listdir(base_directory)
-        if os.path.isdir(os.path.join(base_directory, d))
-    ]
 
-    for infra_folder in infrastructure_folders:
+def document_folder(
+    base_directory,
+    infra_folder,
+    cache=None,
+    collector=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    map_concurrency=DEFAULT_CONCURRENCY,
+    payload="code",
+    limiter=None,
+    max_repairs=DEFAULT_MAX_REPAIRS,
+    max_parse_retries=DEFAULT_MAX_PARSE_RETRIES,
+    stall_timeout=None,
+    backend=None,
+    small_backend=None,
+    small_tokens=0,
+    module_registry=None,
+    variant_of=None,
+):
+    """
+    Extracts the code of a folder and generates its documentation.
+    :param base_directory: Base directory where the repository is located
+    :param infra_folder: Folder to document, relative to base_directory
+    :param cache: Response cache, None to disable
+    :param collector: FileCollector used to read the folder
+    :param token_budget: Code tokens above which the folder is chunked
+    :param map_concurrency: Maximum number of chunks summarised at the same time
+    :param payload: "code" to send the files verbatim, "graph" to send Terraform
+        files as a compact resource graph
+    :param limiter: RateLimiter shared by the run, None to call the model directly
+    :param max_repairs: Calls allowed to fix a diagram that fails validation
+    :param max_parse_retries: Requests repeated after a malformed response
+    :param stall_timeout: Stream the response, aborting it after this many seconds
+        without a token; None to wait for the whole response
+    :param backend: Backend documenting the folder, the default backend when None
+    :param small_backend: Backend documenting folders of at most `small_tokens`
+        code tokens, e.g. a local model; None to use `backend` for every folder
+    :param small_tokens: Size up to which a folder goes to `small_backend`
+    :param module_registry: ModuleRegistry describing the local Terraform modules
+        the folder calls instead of sending their source, None to send the
+        modules inside the folder verbatim
+    :param variant_of: Tuple (base folder, its status in this run or the resumed
+        one) of a near-identical folder to document this one as a diff against, None to
+        document it from its own code
+    :return: FolderResult, with status "skipped" when there is no code
+    """
+    with span("folder", folder=infra_folder) as folder_span:
         infra_path = os.path.join(base_directory, infra_folder)
-        infrastructure_code = extract_infrastructure_code(infra_path)
-        if infrastructure_code.strip():
-            geneate_documentation(infra_folder, infrastructure_code)
+        infrastructure_code, stats, modules = collect_for_documentation(
+            base_directory, infra_folder, collector, payload, module_registry
+        )
+        logger.debug(
+            "Collected %d files (%d bytes) from %s, skipped %d files (%d bytes): %s",
+            stats.files,
+            stats.bytes,
+            infra_folder,
+            stats.skipped_files,
+            stats.skipped_bytes,
+            stats.skipped,
+        )
+        if not infrastructure_code.strip():
+            result = FolderResult(infra_folder, "skipped")
+        else:
+            backend = backend or get_backend()
+            if small_backend and (
+                count_tokens(infrastructure_code, small_backend.model) <= small_tokens
+            ):
+                backend = small_backend
+            variant, saved_tokens = None, 0
+            if variant_of:
+                base_folder, base_status = variant_of
+                # Output left by a failed, timed-out or earlier run is not trusted.
+                if base_status in ("done", "cached"):
+                    base_code, _, _ = collect_for_documentation(
+                        base_directory, base_folder, collector, payload, module_registry
+                    )
+                    variant, saved_tokens = variant_payload(
+                        infra_folder,
+                        infrastructure_code,
+                        base_folder,
+                        base_code,
+                        backend.model,
+                    )
+                else:
+                    logger.info(
+                        "%s is %s, documenting %s in full",
+                        base_folder,
+                        base_status or "not documented",
+                        infra_folder,
+                    )
+            module_usage = (0, 0, 0)
+            # The base documentation already covers the modules of a variant.
+            if modules and not variant:
+                with span("modules", folder=infra_folder, modules=len(modules)):
+                    section, module_usage = module_registry.section(
+                        infra_path,
+                        modules,
+                        partial(
+                            invoke_model,
+                            infra_folder=infra_folder,
+                            limiter=limiter,
+                            backend=backend,
+                        ),
+                        backend.model,
+                    )
+                infrastructure_code += section
+            result = geneate_documentation(
+                infra_folder,
+                infrastructure_code,
+                cache,
+                token_budget,
+                map_concurrency,
+                limiter,
+                max_repairs,
+                max_parse_retries,
+                stall_timeout,
+                backend,
+                variant,
+            )
+            if variant:
+                result.variant_of = variant[0]
+                if result.status == "done":
+                    result.variant_saved_tokens = saved_tokens
+            result.input_tokens += module_usage[0]
+            result.output_tokens += module_usage[1]
+            result.cached_tokens += module_usage[2]
+        result.input_hash = input_hash(infrastructure_code)
+        result.files = stats.files
+        result.bytes = stats.bytes
+        result.skipped_files = stats.skipped_files
+        result.skipped_bytes = stats.skipped_bytes
+        folder_span.set(
+            status=result.status,
+            model=result.model,
+            input_tokens=result.input_tokens,
+            output_tokens=result.output_tokens,
+            cached_tokens=result.cached_tokens,
+            repairs=result.repairs,
+        )
+    return result
+
+
+async def _run_folder(
+    executor, semaphore, document, infra_folder, timeout, on_result=None
+):
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        cancelled = threading.Event()
+
+        def work(infra_folder):
+            loop.call_soon_threadsafe(started.set)
+            _cancelled.set(cancelled)
+            return document(infra_folder)
+
+        future = loop.run_in_executor(executor, in_context(work), infra_folder)
+        # A thread may still be busy with a timed-out folder, so the timeout
+        # starts when the folder's thread does, not when it gets its slot.
+        await started.wait()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(future, timeout)
+            result.duration = time.perf_counter() - start
+        except TimeoutError:
+            # The thread cannot be stopped; it checks this flag before calling
+            # the model and before writing the output and the cache.
+            cancelled.set()
+            logger.error(
+                "Documentation for %s timed out after %ss", infra_folder, timeout
+            )
+            result = FolderResult(
+                infra_folder,
+                "timeout",
+                time.perf_counter() - start,
+                f"timed out after {timeout}s",
+            )
+        except Exception as e:
+            logger.exception("Documentation for %s failed", infra_folder)
+            result = FolderResult(
+                infra_folder, "failed", time.perf_counter() - start, str(e)
+            )
+        if on_result:
+            on_result(result)
+        return result
+
+
+async def _process_folders(
+    document, infra_folders, concurrency, timeout, on_result=None, after=None
+):
+    """
+    :param after: Dict folder -> folders queued once it has completed, such as
+        the variants of a representative
+    :return: List of FolderResult, each folder followed by those queued after it
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    after = after or {}
+
+    async def run(folder):
+        result = await _run_folder(
+            executor, semaphore, document, folder, timeout, on_result
+        )
+        followers = await asyncio.gather(
+            *(run(other) for other in after.get(folder, ()))
+        )
+        return [result] + [r for results in followers for r in results]
+
+    try:
+        started = await asyncio.gather(*(run(folder) for folder in infra_folders))
+        return [result for results in started for result in results]
+    finally:
+        # Timed-out calls are abandoned rather than awaited; the HTTP client
+        # timeout of the backend releases their worker threads.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def log_summary(results):
+    """
+    Logs one line per folder, in folder order, plus the overall totals.
+    Token columns show the input tokens sent, the part of them served from the
+    provider's prompt cache, the input tokens the previous prompt layout (code
+    embedded in both messages) would have sent, and the output tokens; then come
+    the retries and the seconds spent waiting for quota or backoff.
+    :param results: List of FolderResult
+    """
+    logger.info(
+        "%-40s %-8s %7s %9s %9s %9s %9s %7s %9s",
+        "folder",
+        "status",
+        "time",
+        "input",
+        "cached",
+        "before",
+        "output",
+        "retries",
+        "throttled",
+    )
+    for result in results:
+        logger.info(
+            "%-40s %-8s %6.1fs %9d %9d %9d %9d %7d %8.1fs %s",
+            result.folder,
+            result.status,
+            result.duration,
+            result.input_tokens,
+            result.cached_tokens,
+            result.input_tokens + result.saved_tokens,
+            result.output_tokens,
+            result.retries,
+            result.throttled,
+            result.error or "",
+        )
+    failed = sum(1 for r in results if r.status in ("failed", "timeout"))
+    cached = sum(1 for r in results if r.status == "cached")
+    input_tokens = sum(r.input_tokens for r in results)
+    cached_tokens = sum(r.cached_tokens for r in results)
+    saved_tokens = sum(r.saved_tokens for r in results)
+    logger.info(
+        "%d folders processed, %d from cache, %d failed", len(results), cached, failed
+    )
+    logger.info(
+        "%d input tokens (%d from prompt cache, %d uncached), %d before, %d saved",
+        input_tokens,
+        cached_tokens,
+        input_tokens - cached_tokens,
+        input_tokens + saved_tokens,
+        saved_tokens,
+    )
+    logger.info("%d output tokens", sum(r.output_tokens for r in results))
+    logger.info(
+        "%d retries, %.1fs throttled, %d diagram repairs",
+        sum(r.retries for r in results),
+        sum(r.throttled for r in results),
+        sum(r.repairs for r in results),
+    )
+    streamed = [r for r in results if r.first_token is not None]
+    if streamed:
+        logger.info(
+            "Streamed %d folders: %.1fs mean time to first token, %.1f tokens/s",
+            len(streamed),
+            sum(r.first_token for r in streamed) / len(streamed),
+            sum(r.tokens_per_second for r in streamed) / len(streamed),
+        )
+    logger.info(
+        "Collected %d files (%d bytes), skipped %d files (%d bytes)",
+        sum(r.files for r in results),
+        sum(r.bytes for r in results),
+        sum(r.skipped_files for r in results),
+        sum(r.skipped_bytes for r in results),
+    )
+    variants = [r for r in results if r.variant_saved_tokens]
+    if variants:
+        logger.info(
+            "Documented %d folders as diffs against %d representatives, "
+            "%d input tokens saved",
+            len(variants),
+            len({r.variant_of for r in variants}),
+            sum(r.variant_saved_tokens for r in variants),
+        )
+
+
+def find_variants(sketches, threshold=DEFAULT_VARIANT_THRESHOLD):
+    """
+    Groups the near-identical folders, such as the environments of one stack.
+    :param sketches: Dict folder -> sketch of its collected code
+    :param threshold: Minimum estimated similarity of a variant to its representative
+    :return: Dict variant folder -> representative folder
+    """
+    with span("cluster", folders=len(sketches)) as cluster_span:
+        clusters = cluster_sketches(sketches, threshold)
+        variants = {}
+        for cluster in clusters:
+            logger.info(
+                "Variants of %s: %s",
+                cluster.representative,
+                ", ".join(
+                    f"{folder} ({score:.2f})"
+                    for folder, score in cluster.variants.items()
+                ),
+            )
+            for folder in cluster.variants:
+                variants[folder] = cluster.representative
+        cluster_span.set(clusters=len(clusters), variants=len(variants))
+    return variants
+
+
+def plan_folders(
+    base_directory,
+    infra_folders,
+    collector=None,
+    payload="code",
+    module_registry=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    variant_threshold=None,
+    shard=None,
+):
+    """
+    Orders the folders of a run by estimated prompt tokens, largest first, so
+    the longest folders do not start last and hold up the end of the run.
+    Every folder is collected once for the estimates and the variant groups;
+    only its size estimate and sketch are kept. With a shard, only the folders
+    assigned to it are kept.
+    :param variant_threshold: Similarity from which folders are grouped as
+        variants, None or 0 not to group them
+    :param shard: Tuple (index, count) of the shard to keep, numbered from 1,
+        None for every folder
+    :return: Tuple (folders largest first, dict variant folder -> representative
+        folder)
+    """
+    if not (variant_threshold or shard) and len(infra_folders) <= concurrency:
+        # Every folder starts at once, so their order does not matter.
+        return list(infra_folders), {}
+
+    def measure(folder):
+        code = collect_for_documentation(
+            base_directory, folder, collector, payload, module_registry
+        )[0]
+        return estimate_tokens(code), sketch(code) if code.strip() else None
+
+    with span("plan", folders=len(infra_folders)) as plan_span:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            measured = dict(
+                zip(infra_folders, executor.map(in_context(measure), infra_folders))
+            )
+        tokens = {folder: size for folder, (size, _) in measured.items()}
+        sketches = {
+            folder: values for folder, (_, values) in measured.items() if values
+        }
+        variants = (
+            find_variants(sketches, variant_threshold)
+            if variant_threshold and len(sketches) > 1
+            else {}
+        )
+        if shard:
+            index, count = shard
+            # Variants go to the shard of their representative, which writes the
+            # documentation they are generated from.
+            group = {folder: variants.get(folder, folder) for folder in infra_folders}
+            costs = {}
+            for folder, key in group.items():
+                costs[key] = costs.get(key, 0) + tokens[folder]
+            kept = set(assign_shards(costs, count)[index - 1])
+            infra_folders = [
+                folder for folder in infra_folders if group[folder] in kept
+            ]
+            variants = {
+                folder: base
+                for folder, base in variants.items()
+                if group[folder] in kept
+            }
+            logger.info(
+                "Shard %d/%d: %d folders, ~%d of ~%d estimated tokens",
+                index,
+                count,
+                len(infra_folders),
+                sum(tokens[folder] for folder in infra_folders),
+                sum(tokens.values()),
+            )
+            plan_span.set(shard=f"{index}/{count}")
+        ordered = sorted(infra_folders, key=lambda folder: (-tokens[folder], folder))
+        plan_span.set(kept=len(ordered), tokens=sum(tokens[f] for f in ordered))
+    return ordered, variants
+
+
+def pending_folders(infra_folders, manifest=None):
+    """
+    Drops the folders a resumed manifest records as completed and marks the
+    others as pending.
+    :return: List of folders left to document
+    """
+    if manifest is None:
+        return list(infra_folders)
+    completed = manifest.completed()
+    pending = [folder for folder in infra_folders if folder not in completed]
+    if len(pending) < len(infra_folders):
+        logger.info(
+            "Resuming: %d folders already completed, %d left",
+            len(infra_folders) - len(pending),
+            len(pending),
+        )
+    manifest.start(pending)
+    return pending
+
+
+def process_repository(
+    base_directory,
+    concurrency=DEFAULT_CONCURRENCY,
+    timeout=DEFAULT_TIMEOUT,
+    cache=None,
+    folders=None,
+    collector=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    payload="code",
+    limiter=None,
+    max_repairs=DEFAULT_MAX_REPAIRS,
+    max_parse_retries=DEFAULT_MAX_PARSE_RETRIES,
+    manifest=None,
+    stall_timeout=None,
+    backend=None,
+    small_backend=None,
+    small_tokens=0,
+    module_registry=None,
+    variant_threshold=None,
+    shard=None,
+):
+    """
+    Processes each infrastructure folder separately, up to `concurrency` at a time.
+    Folders with the largest estimated prompts are started first.
+    A failing or timed-out folder is recorded in its result and does not stop the others.
+    :param base_directory: Base directory where the repository is located
+    :param concurrency: Maximum number of folders documented at the same time
+    :param timeout: Seconds allowed per folder, None to wait indefinitely
+    :param cache: Response cache shared by all folders, None to disable
+    :param folders: Folders to document, None for every folder of base_directory
+    :param collector: FileCollector used to read each folder, None for the defaults
+    :param token_budget: Code tokens above which a folder is split into chunks that
+        are summarised in parallel before documenting, None to disable
+    :param payload: "code" to send the files verbatim, "graph" to send Terraform
+        files as a compact resource graph
+    :param limiter: RateLimiter shared by all folders, None to call the model directly
+    :param max_repairs: Calls allowed per folder to fix a diagram that fails validation
+    :param max_parse_retries: Requests repeated per folder after a malformed response
+    :param manifest: RunManifest updated after each folder; folders it records as
+        completed are skipped
+    :param stall_timeout: Stream each response to its output files, aborting it
+        after this many seconds without a token; None to wait for whole responses
+    :param backend: Backend documenting the folders, the default backend when None
+    :param small_backend: Backend documenting folders of at most `small_tokens`
+        code tokens, None to use `backend` for every folder
+    :param small_tokens: Size up to which a folder goes to `small_backend`
+    :param module_registry: ModuleRegistry describing each local Terraform module
+        once for every folder that calls it, None to send modules verbatim
+    :param variant_threshold: Similarity from which folders are grouped as variants
+        of one stack; the representative of each group is documented first and
+        the others as diffs against it. None or 0 to document every folder alone
+    :param shard: Tuple (index, count), numbered from 1, to document only this
+        shard's part of the folders; None to document them all
+    :return: List of FolderResult in folder order
+    """
+
+    infrastructure_folders = (
+        list_infrastructure_folders(base_directory) if folders is None else folders
+    )
+    document = partial(
+        document_folder,
+        base_directory,
+        cache=cache,
+        collector=collector,
+        token_budget=token_budget,
+        map_concurrency=concurrency,
+        payload=payload,
+        limiter=limiter,
+        max_repairs=max_repairs,
+        max_parse_retries=max_parse_retries,
+        stall_timeout=stall_timeout,
+        backend=backend,
+        small_backend=small_backend,
+        small_tokens=small_tokens,
+        module_registry=module_registry,
+    )
+
+    statuses = {}
+
+    def finish(result):
+        statuses[result.folder] = result.status
+        # Filled here so folders that failed after retrying are reported too.
+        stats = limiter.stats.get(result.folder) if limiter else None
+        if stats:
+            result.retries, result.throttled = stats.retries, stats.throttled
+        if manifest:
+            manifest.record(result)
+
+    with span(
+        "run",
+        folders=len(infrastructure_folders),
+        concurrency=concurrency,
+        payload=payload,
+        cache=cache is not None,
+    ) as run_span:
+        # A sharded run sizes completed folders too, so that resuming a shard
+        # keeps the assignment the other shards computed.
+        if not shard:
+            infrastructure_folders = pending_folders(infrastructure_folders, manifest)
+        planned, variants = plan_folders(
+            base_directory,
+            infrastructure_folders,
+            collector,
+            payload,
+            module_registry,
+            concurrency,
+            variant_threshold,
+            shard,
+        )
+        if shard:
+            planned = pending_folders(planned, manifest)
+        run_span.set(documented=len(planned))
+
+        def document_any(infra_folder):
+            base_folder = variants.get(infra_folder)
+            if base_folder is None:
+                return document(infra_folder)
+            # Representatives completed by a resumed run are not in `statuses`.
+            base_status = statuses.get(base_folder) or (
+                manifest.status(base_folder) if manifest else None
+            )
+            return document(infra_folder, variant_of=(base_folder, base_status))
+
+        # Variants are queued as soon as their representative is written; those
+        # whose representative is not part of this run start right away.
+        pending = set(planned)
+        after = {}
+        for folder in planned:
+            if variants.get(folder) in pending:
+                after.setdefault(variants[folder], []).append(folder)
+        queued = {folder for followers in after.values() for folder in followers}
+        results = asyncio.run(
+            _process_folders(
+                document_any,
+                [folder for folder in planned if folder not in queued],
+                concurrency,
+                timeout,
+                finish,
+                after,
+            )
+        )
+        order = {folder: i for i, folder in enumerate(infrastructure_folders)}
+        results.sort(key=lambda result: order[result.folder])
+        run_span.set(
+            failed=sum(1 for r in results if r.status in ("failed", "timeout")),
+            cached=sum(1 for r in results if r.status == "cached"),
+        )
+    if manifest:
+        manifest.finish()
+    log_summary(results)
+    if module_registry:
+        module_registry.log_summary()
+    tracer.log_summary(run_span.trace_id)
+    return results
+
+
+def run_batch(
+    base_directory,
+    folders=None,
+    cache=None,
+    collector=None,
+    payload="code",
+    poll_interval=DEFAULT_POLL_INTERVAL,
+    client=None,
+    manifest=None,
+    backend=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    max_repairs=DEFAULT_MAX_REPAIRS,
+    base_url=None,
+):
+    """
+    Documents every folder through the provider's batch interface.
+    Cached folders are restored without being submitted; the others are written
+    to a JSONL batch file, submitted, polled until done and written per folder.
+    The chunks of oversized folders are summarised and invalid diagrams repaired
+    with direct calls, as the batch only answers after it completes.
+    :param base_directory: Base directory where the repository is located
+    :param folders: Folders to document, None for every folder of base_directory
+    :param cache: Response cache, None to disable
+    :param collector: FileCollector used to read each folder
+    :param payload: "code" or "graph", see collect_folder
+    :param poll_interval: Seconds between two status checks of the batch
+    :param client: openai.OpenAI client, built from the environment when None
+    :param manifest: RunManifest recording each folder; folders it records as
+        completed are skipped
+    :param backend: OpenAI backend whose model answers, the default backend when None
+    :param token_budget: Code tokens above which a folder is submitted as the
+        summaries of its chunks, None to always submit the code at once
+    :param max_repairs: Calls allowed per folder to fix a diagram that fails validation
+    :param base_url: OpenAI API URL of the batch client, e.g. of a local stand-in
+        server; the provider default when None
+    :return: List of FolderResult in folder order
+    """
+    from openai import OpenAI
+
+    backend = backend or get_backend()
+    if backend.name != "openai":
+        raise ValueError(f"Batch mode needs the openai backend, not {backend.name}")
+    client = client or OpenAI(base_url=base_url)
+    model = backend.model
+    with span("run", batch=True, payload=payload, cache=cache is not None) as run_span:
+        infrastructure_folders = pending_folders(
+            list_infrastructure_folders(base_directory) if folders is None else folders,
+            manifest,
+        )
+
+        results, requests, pending, collected, hashes = {}, [], {}, {}, {}
+        for infra_folder in infrastructure_folders:
+            infrastructure_code, collected[infra_folder] = collect_folder(
+                base_directory, infra_folder, collector, payload
+            )
+            hashes[infra_folder] = input_hash(infrastructure_code)
+            if not infrastructure_code.strip():
+                results[infra_folder] = FolderResult(infra_folder, "skipped")
+                continue
+            messages = [
+                system_prompt(),
+                human_prompt(infrastructure_code, infra_folder),
+            ]
+            key = cache_key(model, messages) if cache else None
+            cached = cache.get(key) if cache else None
+            if cached:
+                write_documentation(
+                    infra_folder, cached["readme"], cached["diagram_code"]
+                )
+                results[infra_folder] = FolderResult(infra_folder, "cached")
+                continue
+            invoke = partial(invoke_model, infra_folder=infra_folder, backend=backend)
+            map_usage = (0, 0, 0)
+            if not fits_budget(infrastructure_code, token_budget, model):
+                try:
+                    with span("map", folder=infra_folder):
+                        messages, map_usage = summarise_chunks(
+                            in_context(invoke),
+                            model,
+                            infra_folder,
+                            infrastructure_code,
+                            token_budget,
+                            DEFAULT_CONCURRENCY,
+                        )
+                except Exception as e:
+                    logger.exception(
+                        "Summarising %s failed, not submitting it", infra_folder
+                    )
+                    results[infra_folder] = FolderResult(
+                        infra_folder, "failed", error=str(e)
+                    )
+                    continue
+            requests.append(
+                batch_request(infra_folder, model, messages, JSON_RESPONSE_FORMAT)
+            )
+            pending[infra_folder] = (key, infrastructure_code, map_usage)
+
+        if requests:
+            os.makedirs("output", exist_ok=True)
+            batch_path = "output/batch_requests.jsonl"
+            write_batch_file(requests, batch_path)
+            batch = wait_for_batch(
+                client, submit_batch(client, batch_path), poll_interval
+            )
+            responses = fetch_results(client, batch)
+            for infra_folder, (key, infrastructure_code, map_usage) in pending.items():
+                response = responses.get(infra_folder) or {
+                    "error": f"no result, batch {batch.status}"
+                }
+                if "error" in response:
+                    logger.error(
+                        "Documentation for %s failed: %s",
+                        infra_folder,
+                        response["error"],
+                    )
+                    results[infra_folder] = FolderResult(
+                        infra_folder, "failed", error=response["error"]
+                    )
+                    continue
+                try:
+                    readme_content, diagram_code = parse_documentation(
+                        response["content"]
+                    )
+                except MalformedResponse as e:
+                    results[infra_folder] = FolderResult(
+                        infra_folder, "failed", error=str(e)
+                    )
+                    continue
+                usage = response["usage"]
+                batch_usage = (
+                    usage.get("prompt_tokens", 0),
+                    usage.get("completion_tokens", 0),
+                    (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                )
+                try:
+                    diagram_code, repair_usage, repairs, errors = repair_diagram(
+                        partial(
+                            invoke_model, infra_folder=infra_folder, backend=backend
+                        ),
+                        model,
+                        diagram_code,
+                        infrastructure_code,
+                        infra_folder,
+                        max_repairs,
+                    )
+                except Exception:
+                    # The README is still worth keeping; the diagram stays as answered.
+                    logger.exception("Repairing the diagram of %s failed", infra_folder)
+                    repair_usage, repairs = (0, 0, 0), 0
+                    errors = validate_diagram(diagram_code)
+                input_tokens, output_tokens, cached_tokens = (
+                    sum(values)
+                    for values in zip(map_usage, batch_usage, repair_usage, strict=True)
+                )
+                write_documentation(infra_folder, readme_content, diagram_code)
+                if cache and not errors:
+                    cache.put(
+                        key,
+                        readme_content,
+                        diagram_code,
+                        folder=infra_folder,
+                        model=model,
+                    )
+                results[infra_folder] = FolderResult(
+                    infra_folder,
+                    "done",
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    cached_tokens=cached_tokens,
+                    saved_tokens=count_tokens(infrastructure_code, model),
+                    repairs=repairs,
+                    error="; ".join(errors) or None,
+                    model=model,
+                )
+
+    ordered = [results[infra_folder] for infra_folder in infrastructure_folders]
+    for result in ordered:
+        stats = collected[result.folder]
+        result.files, result.bytes = stats.files, stats.bytes
+        result.skipped_files, result.skipped_bytes = (
+            stats.skipped_files,
+            stats.skipped_bytes,
+        )
+        result.input_hash = hashes[result.folder]
+        if manifest:
+            manifest.record(result)
+    if manifest:
+        manifest.finish()
+    log_summary(ordered)
+    tracer.log_summary(run_span.trace_id)
+    return ordered
+
+
+def dry_run(
+    base_directory,
+    folders=None,
+    collector=None,
+    payload="code",
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    concurrency=DEFAULT_CONCURRENCY,
+):
+    """
+    Collects every folder and prints its size and estimated code tokens, without
+    creating any model client. Tokens are estimated from the size of the code
+    rather than counted with a tokenizer, so large repositories are sized quickly.
+    :param token_budget: Code tokens above which a folder would be chunked
+    :return: Dict folder -> estimated tokens
+    """
+    infrastructure_folders = (
+        list_infrastructure_folders(base_directory) if folders is None else folders
+    )
+
+    def estimate(infra_folder):
+        infrastructure_code, stats = collect_folder(
+            base_directory, infra_folder, collector, payload
+        )
+        return stats, estimate_tokens(infrastructure_code)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        estimates = list(executor.map(estimate, infrastructure_folders))
+
+    print(f"{'folder':<40} {'files':>6} {'bytes':>10} {'~tokens':>9}  mode")
+    for infra_folder, (stats, tokens) in zip(
+        infrastructure_folders, estimates, strict=True
+    ):
+        if not tokens:
+            mode = "skipped"
+        elif token_budget and tokens > token_budget:
+            mode = "chunked"
+        else:
+            mode = "single"
+        print(
+            f"{infra_folder:<40} {stats.files:>6} {stats.bytes:>10} {tokens:>9}  {mode}"
+        )
+    total = sum(tokens for _, tokens in estimates)
+    print(
+        f"{len(estimates)} folders, {sum(s.files for s, _ in estimates)} files, "
+        f"~{total} code tokens"
+    )
+    return {
+        infra_folder: tokens
+        for infra_folder, (_, tokens) in zip(
+            infrastructure_folders, estimates, strict=True
+        )
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate documentation for AWS infrastructure code."
+    )
+    parser.add_argument(
+        "base_directory",
+        nargs="?",
+        help="Repository with infrastructure folders; omitted with --repo",
+    )
+    parser.add_argument(
+        "--repo",
+        action="append",
+        metavar="OWNER/NAME[@REF]",
+        help="Read a GitHub repository through the API instead of a local "
+        "directory, can be repeated",
+    )
+    parser.add_argument(
+        "--github-url",
+        default=os.getenv("GITHUB_API_URL", DEFAULT_GITHUB_URL),
+        help="GitHub API URL (default: $GITHUB_API_URL or %(default)s)",
+    )
+    parser.add_argument(
+        "--remote-dir",
+        default=DEFAULT_REMOTE_DIR,
+        help="Blob store and snapshots of --repo repositories (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--archive-threshold",
+        type=int,
+        default=DEFAULT_ARCHIVE_THRESHOLD,
+        help="Missing files above which a repository is downloaded as one tarball "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--top-level-only",
+        action="store_true",
+        help="Document the top-level directories instead of the stack roots "
+        "found at any depth",
+    )
+    parser.add_argument(
+        "--stack-index",
+        help="Index of the stack roots reused across runs "
+        f"(default: <cache dir>/{STACK_INDEX_FILE})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="openai",
+        help="Model backend (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--model",
+        help="Model of the backend (default: gpt-4o, llama3:latest for ollama)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        default=DEFAULT_OLLAMA_URL,
+        help="Ollama server (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--openai-url",
+        default=os.getenv("OPENAI_BASE_URL"),
+        help="OpenAI API URL, e.g. of a local stand-in server "
+        "(default: $OPENAI_BASE_URL or the provider's)",
+    )
+    parser.add_argument(
+        "--fake-latency",
+        type=float,
+        default=0.0,
+        help="Fake backend: seconds before the first token (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fake-tokens-per-second",
+        type=float,
+        default=0.0,
+        help="Fake backend: generation speed, 0 for instant (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--small-backend",
+        choices=BACKENDS,
+        help="Backend for folders of at most --small-tokens code tokens",
+    )
+    parser.add_argument("--small-model", help="Model of --small-backend")
+    parser.add_argument(
+        "--small-tokens",
+        type=int,
+        default=DEFAULT_SMALL_TOKENS,
+        help="Code tokens up to which a folder goes to --small-backend "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Folders documented at the same time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="Seconds allowed per folder, 0 to disable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the response cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_BYTES / 1024 / 1024,
+        help="Size above which old cache entries are evicted (default: %(default)s)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument(
+        "--ignore-file",
+        default=DEFAULT_IGNORE_FILE,
+        help="Ignore file honoured like .gitignore in every folder (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-file-kb",
+        type=float,
+        default=DEFAULT_MAX_FILE_BYTES / 1024,
+        help="Files larger than this are skipped (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help="Code tokens above which a folder is summarised in chunks, "
+        "0 to disable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--payload",
+        choices=["code", "graph"],
+        default="code",
+        help="Send the code verbatim or Terraform as a resource graph "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--inline-modules",
+        action="store_true",
+        help="Send the source of local Terraform modules inside each folder "
+        "instead of describing every module once",
+    )
+    parser.add_argument(
+        "--variant-threshold",
+        type=float,
+        default=DEFAULT_VARIANT_THRESHOLD,
+        help="Similarity from which folders are documented as diffs against a "
+        "representative folder, 0 to document every folder alone "
+        f"(default: {DEFAULT_VARIANT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        help="Requests per minute allowed before the provider reports its limits",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        help="Tokens per minute allowed before the provider reports its limits",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help="Retries of a rate-limited or failed request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-repairs",
+        type=int,
+        default=DEFAULT_MAX_REPAIRS,
+        help="Calls allowed to fix a diagram whose imports fail validation "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-parse-retries",
+        type=int,
+        default=DEFAULT_MAX_PARSE_RETRIES,
+        help="Requests repeated after a response that cannot be parsed "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit all folders through the batch API and wait for the results",
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between two batch status checks (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--base-ref",
+        help="Only document folders with .tf/.ts/.py changes since this git ref",
+    )
+    parser.add_argument(
+        "--head-ref",
+        default="HEAD",
+        help="Git ref compared against --base-ref (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--render",
+        action="store_true",
+        help="Render every output/<folder>/generate_diagram.py after the run",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        help="Diagrams rendered at the same time (default: CPU count)",
+    )
+    parser.add_argument(
+        "--render-timeout",
+        type=float,
+        default=DEFAULT_RENDER_TIMEOUT,
+        help="Seconds allowed per diagram script (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write each response to its files as it is generated",
+    )
+    parser.add_argument(
+        "--stall-timeout",
+        type=float,
+        default=DEFAULT_STALL_TIMEOUT,
+        help="Seconds without a token before a streamed response is aborted "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST,
+        help="Run manifest updated after each folder (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the folders the manifest records as completed",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="I/N",
+        help="Only document shard I of N, balanced by estimated prompt tokens; "
+        "the manifest defaults to output/manifest.shard-I-of-N.json",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only collect the code and print the estimated tokens of each folder",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write the spans of the run to this OTLP JSON file",
+    )
+    parser.add_argument(
+        "--otlp-endpoint",
+        default=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"),
+        help="OTLP/HTTP collector receiving the spans of the run, "
+        "e.g. http://localhost:4318 (default: $OTEL_EXPORTER_OTLP_ENDPOINT)",
+    )
+    args = parser.parse_args(argv)
+    if not args.base_directory and not args.repo:
+        parser.error("a base directory or --repo is required")
+    if args.repo and (args.base_directory or args.base_ref):
+        parser.error("--repo cannot be combined with a base directory or --base-ref")
+    if args.shard:
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.manifest == DEFAULT_MANIFEST:
+            args.manifest = shard_manifest_path(args.manifest, *args.shard)
+    return args
+
+
+def backend_from_args(args, name, model):
+    """
+    Builds a backend from the command-line options.
+    """
+    return create_backend(
+        name,
+        model,
+        timeout=args.timeout or None,
+        base_url=args.ollama_url if name == "ollama" else args.openai_url,
+        latency=args.fake_latency,
+        tokens_per_second=args.fake_tokens_per_second,
+    )
+
+
+def main(argv=None):
+    """
+    Command-line entry point. Model and GitHub clients, and the heavy libraries
+    behind them, are only loaded once they are needed.
+    """
+    global default_backend
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    load_dotenv()
+    args = parse_args(argv)
+    max_file_bytes = int(args.max_file_kb * 1024)
+    if args.repo:
+        # Remote repositories are snapshotted side by side and documented as
+        # folders named <owner>/<name>/<folder>.
+        args.base_directory, folders, _ = fetch_repositories(
+            get_github_client(args.github_url),
+            args.repo,
+            args.remote_dir,
+            args.ignore_file,
+            max_file_bytes,
+            args.archive_threshold,
+            discover=not args.top_level_only,
+        )
+    else:
+        folders = (
+            list_infrastructure_folders(args.base_directory)
+            if args.top_level_only
+            else list(
+                discover_stacks(
+                    args.base_directory,
+                    FileCollector(args.ignore_file, max_file_bytes),
+                    args.stack_index or os.path.join(args.cache_dir, STACK_INDEX_FILE),
+                )
+            )
+        )
+    changed = (
+        changed_folders(
+            args.base_directory,
+            args.base_ref,
+            args.head_ref,
+            folders,
+            # Only described modules end up in the prompts of their callers.
+            None
+            if args.inline_modules or args.batch
+            else FileCollector(args.ignore_file, max_file_bytes),
+        )
+        if args.base_ref
+        else folders
+    )
+    if args.base_ref:
+        logger.info(
+            "%d folders changed between %s and %s: %s",
+            len(changed),
+            args.base_ref,
+            args.head_ref,
+            ", ".join(changed) or "none",
+        )
+    # Stack roots nested in another one are documented on their own only.
+    collector = FileCollector(
+        args.ignore_file,
+        max_file_bytes,
+        boundaries=[os.path.join(args.base_directory, folder) for folder in folders],
+    )
+    if args.shard and (args.dry_run or args.batch):
+        # process_repository shards the folders itself, along with its plan.
+        changed, _ = plan_folders(
+            args.base_directory,
+            changed,
+            collector,
+            args.payload,
+            None if args.inline_modules or args.batch else ModuleRegistry(collector),
+            args.concurrency,
+            args.variant_threshold,
+            args.shard,
+        )
+    if args.dry_run:
+        dry_run(
+            args.base_directory,
+            changed,
+            collector,
+            args.payload,
+            args.token_budget or None,
+            args.concurrency,
+        )
+        return
+    try:
+        default_backend = backend_from_args(args, args.backend, args.model)
+        small_backend = (
+            backend_from_args(args, args.small_backend, args.small_model)
+            if args.small_backend
+            else None
+        )
+    except ValueError as e:
+        raise SystemExit(f"error: {e}") from None
+    response_cache = (
+        None
+        if args.no_cache
+        else ResponseCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    )
+    run_manifest = RunManifest(
+        args.manifest,
+        args.resume,
+        "/".join(map(str, args.shard)) if args.shard else None,
+    )
+    if args.batch:
+        run_batch(
+            args.base_directory,
+            changed,
+            response_cache,
+            collector,
+            args.payload,
+            args.batch_poll_interval,
+            manifest=run_manifest,
+            token_budget=args.token_budget or None,
+            max_repairs=args.max_repairs,
+            base_url=args.openai_url,
+        )
+    else:
+        process_repository(
+            args.base_directory,
+            args.concurrency,
+            args.timeout or None,
+            response_cache,
+            changed,
+            collector,
+            args.token_budget or None,
+            args.payload,
+            RateLimiter(args.rpm, args.tpm, args.max_retries),
+            args.max_repairs,
+            args.max_parse_retries,
+            run_manifest,
+            args.stall_timeout if args.stream else None,
+            small_backend=small_backend,
+            small_tokens=args.small_tokens,
+            module_registry=(
+                None
+                if args.inline_modules
+                else ModuleRegistry(collector, response_cache)
+            ),
+            variant_threshold=args.variant_threshold,
+            shard=args.shard,
+        )
+    if args.trace_file:
+        tracer.write_json(args.trace_file)
+    if args.otlp_endpoint:
+        tracer.export_otlp(args.otlp_endpoint)
+    if args.render:
+        render_diagrams("output", args.render_workers, args.render_timeout)
 
 
 if __name__ == "__main__":
-    process_repository(sys.argv[1])
+    main()
@@ -0,0 +1,96 @@
+"""
+Incremental mode: finds the infrastructure folders touched between two git refs
+of a local checkout, so only those folders are documented again.
+"""
+
+import os
+import posixpath
+import subprocess
+
+from collector import INFRA_EXTENSIONS, PRUNED_DIRECTORIES
+from modules import local_modules
+
+
+def changed_files(base_directory, base_ref, head_ref="HEAD"):
+    """
+    Lists the files changed between two refs, relative to base_directory.
+    Uses the merge base of both refs, like a pull request diff.
+    :param base_directory: Directory inside a git checkout
+    :param base_ref: Ref the changes are compared against (e.g. origin/main)
+    :param head_ref: Ref with the changes
+    :return: List of paths relative to base_directory, renames reported on both sides
+    """
+    command = [
+        "git",
+        "-C",
+        base_directory,
+        "diff",
+        "--name-only",
+        "--no-renames",
+        "--relative",
+        f"{base_ref}...{head_ref}",
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"git diff {base_ref}...{head_ref} failed: {result.stderr.strip()}"
+        )
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def changed_folders(
+    base_directory, base_ref, head_ref="HEAD", roots=None, module_collector=None
+):
+    """
+    Maps the infrastructure files changed between two refs to their folders.
+    Folders that no longer exist (deleted stacks) are left out.
+    :param base_directory: Base directory where the repository is located
+    :param base_ref: Ref the changes are compared against
+    :param head_ref: Ref with the changes
+    :param roots: Stack roots, relative to base_directory with "/" separators; a
+        file maps to the deepest root containing it. None to map files to their
+        top-level folder
+    :param module_collector: FileCollector resolving the local modules of each
+        folder; folders calling a changed module are changed too, since their
+        prompt describes it. None not to follow modules
+    :return: Sorted list of folder names, relative to base_directory
+    """
+    paths = [
+        path
+        for path in changed_files(base_directory, base_ref, head_ref)
+        if path.endswith(INFRA_EXTENSIONS)
+    ]
+    candidates = None if roots is None else set(roots)
+    folders = set()
+    for path in paths:
+        if candidates is not None:
+            folder = posixpath.dirname(path)
+            while folder and folder not in candidates:
+                folder = posixpath.dirname(folder)
+            if folder:
+                folders.add(folder)
+            continue
+        top_level, sep, _ = path.partition("/")
+        if sep and os.path.isdir(os.path.join(base_directory, top_level)):
+            folders.add(top_level)
+
+    if module_collector is not None and paths:
+        directories = {
+            os.path.abspath(os.path.join(base_directory, posixpath.dirname(path)))
+            for path in paths
+        }
+        if roots is None:
+            roots = [
+                entry.name
+                for entry in os.scandir(base_directory)
+                if entry.is_dir() and entry.name not in PRUNED_DIRECTORIES
+            ]
+        for root in set(roots) - folders:
+            path = os.path.join(base_directory, root)
+            if any(
+                os.path.commonpath([directory, module]) == module
+                for module in local_modules(path, module_collector)
+                for directory in directories
+            ):
+                folders.add(root)
+    return sorted(folders)
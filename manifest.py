@@ -0,0 +1,123 @@
+"""
+Run manifest recording the state and cost of every folder of a run.
+The manifest is rewritten atomically after each folder, so a run that dies part
+way can be resumed without documenting its completed folders again.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict
+
+from atomic import write_atomic
+
+DEFAULT_MANIFEST = "output/manifest.json"
+COMPLETED_STATUSES = ("done", "cached", "skipped")
+OUTPUT_FILES = ("README.md", "generate_diagram.py")
+
+logger = logging.getLogger(__name__)
+
+
+def manifest_totals(entries):
+    """
+    :param entries: Folder entries of a manifest
+    :return: Dict with the total input, cached and output tokens of the entries
+    """
+    return {
+        field: sum(entry.get(field, 0) for entry in entries)
+        for field in ("input_tokens", "cached_tokens", "output_tokens")
+    }
+
+
+def input_hash(infrastructure_code: str) -> str:
+    """
+    :return: Hex digest of the payload collected for a folder
+    """
+    return hashlib.sha256(infrastructure_code.encode("utf-8")).hexdigest()
+
+
+class RunManifest:
+    """
+    Per-folder state of a run: pending, done, cached, skipped, failed or timeout,
+    with the input hash, token usage, duration and output paths of each folder.
+    :param path: JSON file the manifest is written to
+    :param resume: Keep the folders completed by the previous run at `path`
+    :param shard: "i/N" of the shard the run documents, None for a whole run
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST, resume=False, shard=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"started": time.time(), "finished": None, "folders": {}}
+        if shard:
+            self.data["shard"] = shard
+        if resume:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    previous = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("No manifest to resume at %s, starting over", path)
+            else:
+                self.data["folders"] = {
+                    folder: entry
+                    for folder, entry in previous.get("folders", {}).items()
+                    if entry.get("status") in COMPLETED_STATUSES
+                }
+
+    def completed(self):
+        """
+        :return: Set of folders completed by a previous run
+        """
+        with self.lock:
+            return {
+                folder
+                for folder, entry in self.data["folders"].items()
+                if entry.get("status") in COMPLETED_STATUSES
+            }
+
+    def status(self, folder):
+        """
+        :return: Status recorded for a folder, None when it has no entry
+        """
+        with self.lock:
+            return self.data["folders"].get(folder, {}).get("status")
+
+    def _write(self):
+        write_atomic(self.path, json.dumps(self.data, indent=2))
+
+    def start(self, folders):
+        """
+        Marks the folders of the run as pending, keeping resumed ones.
+        """
+        with self.lock:
+            for folder in folders:
+                self.data["folders"].setdefault(folder, {"status": "pending"})
+            self._write()
+
+    def record(self, result):
+        """
+        Records the outcome of one folder and rewrites the manifest.
+        :param result: FolderResult of the folder
+        """
+        entry = asdict(result)
+        del entry["folder"]
+        entry["outputs"] = (
+            [f"output/{result.folder}/{name}" for name in OUTPUT_FILES]
+            if result.status in ("done", "cached")
+            else []
+        )
+        entry["updated"] = time.time()
+        with self.lock:
+            self.data["folders"][result.folder] = entry
+            self._write()
+
+    def finish(self):
+        """
+        Records the end of the run with its total token usage.
+        """
+        with self.lock:
+            self.data["finished"] = time.time()
+            self.data["totals"] = manifest_totals(self.data["folders"].values())
+            self._write()
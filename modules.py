@@ -0,0 +1,169 @@
+"""
+Local Terraform modules shared by several folders.
+Module blocks with a relative `source` are resolved, and each distinct module is
+described once per run, keyed by a hash of its code; folders that call it get the
+description in their prompt instead of the module's source.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future
+
+from cache import cache_key
+from collector import FILE_HEADER, FileCollector
+from promtps import module_prompt, module_system_prompt
+from tokens import response_usage
+
+# Relative sources only: registry and git sources are not read from disk.
+MODULE_SOURCE = re.compile(r'^\s*source\s*=\s*"(\.\.?/[^"]*)"', re.MULTILINE)
+
+logger = logging.getLogger(__name__)
+
+
+def _inside(path, directory):
+    return os.path.commonpath([path, directory]) == directory
+
+
+def local_modules(directory, collector=None):
+    """
+    Finds the local modules a folder calls, directly or through other modules.
+    Sources pointing at the folder itself or one of its parents are ignored.
+    :param directory: Folder to scan
+    :param collector: FileCollector with the ignore rules to apply
+    :return: Sorted absolute paths of the module directories
+    """
+    collector = collector or FileCollector()
+    root = os.path.abspath(directory)
+    found, pending, scanned = set(), [root], set()
+    while pending:
+        current = pending.pop()
+        if current in scanned:
+            continue
+        scanned.add(current)
+        for path, content in collector.iter_files(current):
+            if not path.endswith(".tf"):
+                continue
+            base = os.path.dirname(os.path.join(current, path))
+            for source in MODULE_SOURCE.findall(content):
+                module = os.path.normpath(os.path.join(base, source))
+                if _inside(root, module) or not os.path.isdir(module):
+                    continue
+                found.add(module)
+                if not _inside(module, root):
+                    # Modules inside the folder are walked with it already.
+                    pending.append(module)
+    return sorted(found)
+
+
+class ModuleRegistry:
+    """
+    Descriptions of the local modules of a run, generated once per distinct
+    module code even when several folders ask for it at the same time. When the
+    folder describing a module fails, a folder waiting for it describes it again.
+    Descriptions are also kept in the response cache, so they are stable from
+    one run to the next and the prompts of unchanged folders stay cached.
+    :param collector: FileCollector used to read the modules
+    :param cache: ResponseCache, None to describe the modules again on every run
+    """
+
+    def __init__(self, collector=None, cache=None):
+        self.collector = collector or FileCollector()
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.generated = 0
+        self.references = 0
+
+    def describe(self, module_directory, invoke, model):
+        """
+        :param module_directory: Directory of the module
+        :param invoke: Callable sending a list of messages to the model
+        :param model: Model name, part of the cache key
+        :return: Tuple (digest of the module code, description,
+            (input_tokens, output_tokens, cached_tokens) spent on it by this call)
+        """
+        code, _ = self.collector.collect(module_directory)
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        memo_key = (model, digest)
+        with self.lock:
+            self.references += 1
+        while True:
+            with self.lock:
+                future = self.descriptions.get(memo_key)
+                owner = future is None
+                if owner:
+                    future = self.descriptions[memo_key] = Future()
+            if owner:
+                break
+            description = future.result()
+            if description is not None:
+                return digest, description, (0, 0, 0)
+            # The folder describing it failed or was abandoned; its error is its
+            # own, so this folder describes the module itself.
+
+        try:
+            # Named after its directory only, so the prompt and its cache key do
+            # not depend on which folder asked first.
+            module_name = os.path.basename(module_directory)
+            messages = [module_system_prompt(), module_prompt(code, module_name)]
+            key = cache_key(model, messages) if self.cache else None
+            cached = self.cache.get(key) if self.cache else None
+            usage = (0, 0, 0)
+            if cached:
+                description = cached["readme"]
+            else:
+                response = invoke(messages)
+                description = str(response.content).strip()
+                usage = response_usage(response, messages, model)
+                with self.lock:
+                    self.generated += 1
+                if self.cache:
+                    # Stored like a README without a diagram.
+                    self.cache.put(
+                        key,
+                        description,
+                        "",
+                        folder=f"module {module_name}",
+                        model=model,
+                    )
+        except BaseException:
+            with self.lock:
+                del self.descriptions[memo_key]
+            future.set_result(None)
+            raise
+        future.set_result(description)
+        return digest, description, usage
+
+    def section(self, directory, modules, invoke, model):
+        """
+        Builds the part of a folder's payload that describes its local modules.
+        :param directory: Folder calling the modules
+        :param modules: Module directories, see local_modules
+        :return: Tuple (section text, (input_tokens, output_tokens, cached_tokens)
+            spent describing modules for this folder)
+        """
+        parts, usage = [], [0, 0, 0]
+        root = os.path.abspath(directory)
+        for module in modules:
+            name = os.path.relpath(module, root).replace(os.sep, "/")
+            digest, description, spent = self.describe(module, invoke, model)
+            for i, value in enumerate(spent):
+                usage[i] += value
+            parts.append(f"## Module `{name}` ({digest[:12]})\n{description}\n")
+        section = (
+            f"{FILE_HEADER}local modules (described, source not included)\n"
+            + "\n".join(parts)
+            + "\n"
+        )
+        return section, tuple(usage)
+
+    def log_summary(self):
+        logger.info(
+            "%d local modules described, %d generated, %d references",
+            len(self.descriptions),
+            self.generated,
+            self.references,
+        )
@@ -0,0 +1,98 @@
+"""
+Parsing of model responses into the README and the diagram code.
+Responses are requested as a JSON object with `readme` and `diagram_code` fields;
+free-text replies with a python block are still accepted.
+"""
+
+import json
+import re
+
+JSON_BLOCK = re.compile(r"```(?:json)?[ \t]*\n(\{.*\})[ \t]*\n?[ \t]*```", re.DOTALL)
+# Only blocks opened as python are diagram candidates; README blocks (bash, hcl...)
+# are never mistaken for the diagram, even when the README is itself fenced.
+PYTHON_BLOCK = re.compile(r"```(?:python3?|py)[ \t]*\n(.*?)```", re.DOTALL)
+MARKDOWN_FENCE = re.compile(
+    r"\A```(?:markdown|md)?[ \t]*\n(.*)\n[ \t]*```\Z", re.DOTALL
+)
+DIAGRAM_HEADING = re.compile(
+    r"^[ \t]*#+[ \t]*\**`?generate_diagram\.py`?\**[ \t]*:?[ \t]*\n?", re.MULTILINE
+)
+
+
+class MalformedResponse(ValueError):
+    """
+    Raised when a response holds no usable README or diagram code.
+    """
+
+
+def _json_object(content):
+    candidates = [content.strip()]
+    candidates += JSON_BLOCK.findall(content)
+    start, end = content.find("{"), content.rfind("}")
+    if start != -1 and end > start:
+        candidates.append(content[start : end + 1])
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def _unfence(code):
+    match = PYTHON_BLOCK.search(code)
+    return match.group(1) if match else code
+
+
+def _parse_text(content):
+    blocks = list(PYTHON_BLOCK.finditer(content))
+    if not blocks:
+        raise MalformedResponse("response has neither JSON nor a python block")
+    # The diagram is the block that uses `diagrams`, the last one otherwise.
+    diagram = next((b for b in blocks if "diagrams" in b.group(1)), blocks[-1])
+    readme = content[: diagram.start()] + content[diagram.end() :]
+    readme = DIAGRAM_HEADING.sub("", readme).strip()
+    match = MARKDOWN_FENCE.match(readme)
+    if match:
+        readme = match.group(1)
+    return readme, diagram.group(1)
+
+
+def parse_documentation(content: str):
+    """
+    Splits a model response into the README and the diagram code.
+    :param content: JSON object with `readme` and `diagram_code`, or free text with
+        the README in markdown and the diagram in a python block
+    :return: Tuple (readme_content, diagram_code)
+    :raises MalformedResponse: When the README or the diagram code is missing
+    """
+    data = _json_object(content)
+    if (
+        data
+        and isinstance(data.get("readme"), str)
+        and isinstance(data.get("diagram_code"), str)
+    ):
+        readme_content, diagram_code = data["readme"], _unfence(data["diagram_code"])
+    else:
+        readme_content, diagram_code = _parse_text(content)
+
+    readme_content = DIAGRAM_HEADING.sub("", readme_content).strip()
+    diagram_code = diagram_code.strip()
+    if not readme_content:
+        raise MalformedResponse("response has no README")
+    if not diagram_code:
+        raise MalformedResponse("response has no diagram code")
+    return readme_content, diagram_code
+
+
+def parse_diagram_code(content: str) -> str:
+    """
+    Takes the diagram code out of a repair reply: the `diagram_code` field of a
+    JSON object, a python block, or the whole reply when it has neither.
+    """
+    data = _json_object(content)
+    if data and isinstance(data.get("diagram_code"), str):
+        return _unfence(data["diagram_code"]).strip()
+    return _unfence(content).strip()
@@ -0,0 +1,234 @@
+"""
+Client-side rate limiting shared by all folders of a run.
+Requests and tokens per minute are metered with token buckets that adapt to the
+x-ratelimit-* headers returned by the provider, and rate-limited or transient
+failures are retried with jittered exponential backoff.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from tracing import span
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_duration(value):
+    """
+    Parses reset durations such as "20ms", "1s" or "6m0s".
+    :return: Seconds, or None when the value is missing or not a duration
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _int_header(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Meters a per-minute budget. Callers reserve capacity up front and sleep for
+    the returned delay, so concurrent callers queue fairly instead of racing.
+    :param per_minute: Budget per minute, None for no client-side limit until the
+        provider reports one
+    """
+
+    def __init__(self, per_minute=None):
+        self.capacity = per_minute
+        self.level = per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.capacity:
+            refill = (now - self.updated) * self.capacity / 60
+            self.level = min(self.capacity, self.level + refill)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Takes `amount` from the bucket.
+        :return: Seconds to wait before the reservation is covered
+        """
+        with self.lock:
+            if not self.capacity:
+                return 0.0
+            self._refill(time.monotonic())
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level * 60 / self.capacity
+
+    def adjust(self, amount):
+        """
+        Corrects a reservation once the real cost is known; negative refunds.
+        """
+        with self.lock:
+            if self.capacity:
+                self._refill(time.monotonic())
+                self.level -= amount
+
+    def update(self, limit, remaining):
+        """
+        Adapts the bucket to the limit and remaining quota reported by the provider.
+        """
+        with self.lock:
+            if limit:
+                self.capacity = limit
+            self._refill(time.monotonic())
+            if remaining is not None and self.capacity:
+                self.level = min(self.level, remaining)
+
+
+@dataclass
+class ThrottleStats:
+    """
+    Retries and seconds spent waiting for quota or backoff, for one folder.
+    """
+
+    retries: int = 0
+    throttled: float = 0.0
+
+
+class RateLimiter:
+    """
+    Wraps model calls with request/token buckets and retries.
+    :param requests_per_minute: Initial request budget, None to rely on headers
+    :param tokens_per_minute: Initial token budget, None to rely on headers
+    :param max_retries: Retries of a call before its error is raised
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def _wait(self, seconds, folder):
+        if seconds > 0:
+            with span("throttle", folder=folder, seconds=seconds):
+                time.sleep(seconds)
+            with self.lock:
+                self.stats.setdefault(folder, ThrottleStats()).throttled += seconds
+
+    def _retry_delay(self, error, attempt):
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return float(retry_after_ms) / 1000
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after
+        # Full jitter keeps concurrent folders from retrying in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def observe(self, headers):
+        """
+        Adapts both buckets to x-ratelimit-* response headers.
+        """
+        if not headers:
+            return
+        self.requests.update(
+            _int_header(headers, "x-ratelimit-limit-requests"),
+            _int_header(headers, "x-ratelimit-remaining-requests"),
+        )
+        self.tokens.update(
+            _int_header(headers, "x-ratelimit-limit-tokens"),
+            _int_header(headers, "x-ratelimit-remaining-tokens"),
+        )
+
+    def call(self, fn, estimated_tokens, folder, actual_tokens=None):
+        """
+        Calls `fn` within the limits, retrying rate-limited and transient errors.
+        :param fn: Callable performing one model request and returning its response
+        :param estimated_tokens: Tokens reserved before the call
+        :param folder: Folder the call is accounted to
+        :param actual_tokens: Callable returning the tokens used by a response
+        :return: The response of `fn`
+        """
+        attempt = 0
+        while True:
+            with self.lock:
+                pause = self.paused_until - time.monotonic()
+            self._wait(pause, folder)
+            self._wait(
+                max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens)),
+                folder,
+            )
+            try:
+                response = fn()
+            except Exception as e:
+                import openai
+
+                status = getattr(e, "status_code", None)
+                retryable = status in RETRY_STATUS_CODES or isinstance(
+                    e,
+                    (
+                        openai.APIConnectionError,
+                        openai.APITimeoutError,
+                        ConnectionError,
+                    ),
+                )
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if status == 429:
+                    # The quota is shared: hold every caller, not only this one.
+                    with self.lock:
+                        self.paused_until = max(
+                            self.paused_until, time.monotonic() + delay
+                        )
+                with self.lock:
+                    self.stats.setdefault(folder, ThrottleStats()).retries += 1
+                logger.warning(
+                    "Retrying %s in %.1fs (attempt %d/%d): %s",
+                    folder,
+                    delay,
+                    attempt + 1,
+                    self.max_retries,
+                    e,
+                )
+                self._wait(delay, folder)
+                attempt += 1
+                continue
+
+            metadata = getattr(response, "response_metadata", None) or {}
+            self.observe(metadata.get("headers"))
+            if actual_tokens:
+                self.tokens.adjust(actual_tokens(response) - estimated_tokens)
+            return response
@@ -0,0 +1,327 @@
+"""
+Remote repositories read through the GitHub API instead of a clone.
+The ref is resolved with a conditional request, the tree is listed in one
+recursive call, and the infrastructure files are fetched into a blob store keyed
+by their git SHA, one blob at a time or as a single tarball when many are
+missing. Unchanged files are never downloaded again. The files are then laid out
+in a local snapshot that the rest of the pipeline reads like a checkout.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from atomic import write_atomic
+from collector import (
+    DEFAULT_IGNORE_FILE,
+    DEFAULT_MAX_FILE_BYTES,
+    INFRA_EXTENSIONS,
+    PRUNED_DIRECTORIES,
+    FileCollector,
+)
+from stacks import MARKER_FILES, discover_stacks
+
+DEFAULT_REMOTE_DIR = ".docs-remote"
+DEFAULT_GITHUB_URL = "https://api.github.com"
+DEFAULT_FETCH_WORKERS = 8
+# Above this many missing blobs, one tarball is cheaper than one request per blob.
+DEFAULT_ARCHIVE_THRESHOLD = 50
+ARCHIVE_TIMEOUT = 300
+
+logger = logging.getLogger(__name__)
+
+
+def parse_repo_spec(spec: str):
+    """
+    Parses "owner/name" or "owner/name@ref".
+    :return: Tuple (full_name, ref), ref None for the default branch
+    """
+    full_name, _, ref = spec.partition("@")
+    if full_name.count("/") != 1 or not all(full_name.split("/")):
+        raise ValueError(f"Expected owner/name[@ref], got {spec!r}")
+    return full_name, ref or None
+
+
+def git_blob_sha(data: bytes) -> str:
+    """
+    :return: The SHA-1 git gives to a blob with this content
+    """
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed store of file contents, one file per git blob SHA.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha)
+
+    def __contains__(self, sha):
+        return os.path.exists(self.path(sha))
+
+    def put(self, sha, data):
+        """
+        Stores a blob after checking that its content matches its SHA.
+        """
+        if git_blob_sha(data) != sha:
+            raise ValueError(f"Content of blob {sha} does not match its SHA")
+        write_atomic(self.path(sha), data)
+
+    def copy_to(self, sha, destination):
+        """
+        Places a blob at `destination`, hard-linked when the filesystem allows.
+        """
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(self.path(sha), destination)
+        except OSError:
+            shutil.copyfile(self.path(sha), destination)
+
+
+@dataclass
+class SnapshotStats:
+    """
+    What fetching a remote repository cost.
+    `cached` blobs were already in the store, `downloaded` were fetched, through
+    the tarball when `archive` is set.
+    """
+
+    repository: str
+    commit: str
+    files: int = 0
+    cached: int = 0
+    downloaded: int = 0
+    archive: bool = False
+    ref_cached: bool = False
+
+
+class RemoteRepository:
+    """
+    One repository and ref read through a PyGithub client.
+    :param client: github.Github client, e.g. pointed at a stand-in server
+    :param full_name: "owner/name"
+    :param ref: Branch, tag or commit, None for the default branch
+    :param directory: Directory of the blob store, ref and tree caches and snapshots
+    :param ignore_file: Docs ignore file, fetched along with `.gitignore` files
+    :param max_file_bytes: Files larger than this are not fetched
+    :param archive_threshold: Missing blobs above which the tarball is downloaded
+    :param workers: Blobs downloaded at the same time
+    """
+
+    def __init__(
+        self,
+        client,
+        full_name,
+        ref=None,
+        directory=DEFAULT_REMOTE_DIR,
+        ignore_file=DEFAULT_IGNORE_FILE,
+        max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+        archive_threshold=DEFAULT_ARCHIVE_THRESHOLD,
+        workers=DEFAULT_FETCH_WORKERS,
+    ):
+        self.client = client
+        self.full_name = full_name
+        self.ref = ref
+        self.directory = directory
+        self.ignore_files = (".gitignore", ignore_file)
+        self.max_file_bytes = max_file_bytes
+        self.archive_threshold = archive_threshold
+        self.workers = workers
+        self.blobs = BlobStore(os.path.join(directory, "blobs"))
+        self.repo = client.get_repo(full_name)
+
+    def _refs_path(self):
+        return os.path.join(self.directory, "refs.json")
+
+    def resolve(self, stats=None):
+        """
+        Resolves the ref to a commit SHA. The ETag of the previous answer is sent
+        back, so an unchanged ref costs a 304 that does not count against the
+        rate limit.
+        :return: Commit SHA
+        """
+        key = f"{self.full_name}@{self.ref or ''}"
+        try:
+            with open(self._refs_path(), "r", encoding="utf-8") as f:
+                refs = json.load(f)
+        except (OSError, ValueError):
+            refs = {}
+        known = refs.get(key)
+        # HEAD resolves to the default branch without fetching the repository.
+        ref = self.ref or "HEAD"
+        headers = {"If-None-Match": known["etag"]} if known else {}
+        # PyGithub has no conditional variant of get_commit, so its requester is used.
+        response_headers, data = self.repo._requester.requestJsonAndCheck(
+            "GET", f"{self.repo.url}/commits/{ref}", headers=headers
+        )
+        if known and not data:
+            if stats:
+                stats.ref_cached = True
+            return known["sha"]
+        refs[key] = {"etag": response_headers.get("etag"), "sha": data["sha"]}
+        write_atomic(self._refs_path(), json.dumps(refs, indent=2).encode())
+        return data["sha"]
+
+    def _wanted(self, path, size):
+        parts = path.split("/")
+        if any(part in PRUNED_DIRECTORIES for part in parts[:-1]):
+            return False
+        if parts[-1] in self.ignore_files or parts[-1] in MARKER_FILES:
+            return True
+        return path.endswith(INFRA_EXTENSIONS) and size <= self.max_file_bytes
+
+    def tree(self, commit):
+        """
+        Lists the infrastructure and ignore files of a commit in one recursive
+        call. Trees of a commit never change, so they are cached by commit SHA.
+        :return: Dict path -> blob SHA
+        """
+        path = os.path.join(
+            self.directory, "trees", *self.full_name.split("/"), f"{commit}.json"
+        )
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        tree = self.repo.get_git_tree(commit, recursive=True)
+        if tree.raw_data.get("truncated"):
+            logger.warning(
+                "Tree of %s is truncated by the API, some files are missing",
+                self.full_name,
+            )
+        files = {
+            element.path: element.sha
+            for element in tree.tree
+            if element.type == "blob" and self._wanted(element.path, element.size or 0)
+        }
+        write_atomic(path, json.dumps(files, indent=2).encode())
+        return files
+
+    def _fetch_blob(self, sha):
+        blob = self.repo.get_git_blob(sha)
+        self.blobs.put(sha, base64.b64decode(blob.content))
+
+    def _fetch_archive(self, commit, missing):
+        url = self.repo.get_archive_link("tarball", commit)
+        headers = {}
+        token = os.getenv("GITHUB_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        request = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(request, timeout=ARCHIVE_TIMEOUT) as response:
+            archive = io.BytesIO(response.read())
+        with tarfile.open(fileobj=archive, mode="r:gz") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                # Members are prefixed with "<owner>-<name>-<sha>/".
+                path = member.name.partition("/")[2]
+                sha = missing.get(path)
+                if sha and sha not in self.blobs:
+                    self.blobs.put(sha, tar.extractfile(member).read())
+
+    def snapshot(self, destination):
+        """
+        Fetches the missing blobs and lays the files out under `destination`,
+        replacing a previous snapshot.
+        :return: SnapshotStats
+        """
+        stats = SnapshotStats(self.full_name, "")
+        stats.commit = commit = self.resolve(stats)
+        files = self.tree(commit)
+        missing = {path: sha for path, sha in files.items() if sha not in self.blobs}
+        stats.files = len(files)
+        stats.downloaded = len(set(missing.values()))
+        stats.cached = stats.files - len(missing)
+        if len(missing) > self.archive_threshold:
+            stats.archive = True
+            self._fetch_archive(commit, missing)
+        # Blobs the archive did not provide are fetched one by one.
+        remaining = {sha for sha in missing.values() if sha not in self.blobs}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self._fetch_blob, remaining))
+
+        shutil.rmtree(destination, ignore_errors=True)
+        for path, sha in files.items():
+            target = os.path.join(destination, *posixpath.normpath(path).split("/"))
+            if os.path.commonpath(
+                [os.path.abspath(target), os.path.abspath(destination)]
+            ) != os.path.abspath(destination):
+                raise ValueError(f"Unsafe path {path!r} in {self.full_name}")
+            self.blobs.copy_to(sha, target)
+        # Marks the snapshot as a checkout root, so .gitignore files above a
+        # folder apply as they would in a clone.
+        os.makedirs(os.path.join(destination, ".git"), exist_ok=True)
+        logger.info(
+            "%s@%s: %d files, %d cached, %d downloaded%s",
+            self.full_name,
+            commit[:12],
+            stats.files,
+            stats.cached,
+            stats.downloaded,
+            " from the tarball" if stats.archive else "",
+        )
+        return stats
+
+
+def fetch_repositories(
+    client,
+    specs,
+    directory=DEFAULT_REMOTE_DIR,
+    ignore_file=DEFAULT_IGNORE_FILE,
+    max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+    archive_threshold=DEFAULT_ARCHIVE_THRESHOLD,
+    discover=True,
+):
+    """
+    Snapshots several remote repositories side by side under
+    `<directory>/checkouts/<owner>/<name>/`.
+    :param client: github.Github client
+    :param specs: "owner/name[@ref]" strings
+    :param discover: Find the stack roots of each repository at any depth, False
+        to take its top-level directories
+    :return: Tuple (checkouts directory, folders relative to it, e.g.
+        "owner/name/network", list of SnapshotStats)
+    """
+    root = os.path.join(directory, "checkouts")
+    folders, all_stats = [], []
+    for spec in specs:
+        full_name, ref = parse_repo_spec(spec)
+        repository = RemoteRepository(
+            client,
+            full_name,
+            ref,
+            directory,
+            ignore_file,
+            max_file_bytes,
+            archive_threshold,
+        )
+        destination = os.path.join(root, *full_name.split("/"))
+        all_stats.append(repository.snapshot(destination))
+        if discover:
+            # Snapshots are laid out again on every run, so they are not indexed.
+            roots = discover_stacks(
+                destination, FileCollector(ignore_file, max_file_bytes)
+            )
+        else:
+            roots = [
+                entry.name
+                for entry in sorted(os.scandir(destination), key=lambda e: e.name)
+                if entry.is_dir() and entry.name not in PRUNED_DIRECTORIES
+            ]
+        folders.extend(f"{full_name}/{root}" for root in roots)
+    return root, folders, all_stats
@@ -0,0 +1,163 @@
+"""
+Renders the generated generate_diagram.py scripts into architecture.png.
+Each script runs as its own Python process, in its own output directory and with
+a timeout, several at a time; failures are collected into a summary.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+DIAGRAM_SCRIPT = "generate_diagram.py"
+DIAGRAM_IMAGE = "architecture.png"
+DEFAULT_RENDER_TIMEOUT = 120.0
+ERROR_TAIL_CHARS = 2000
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RenderResult:
+    """
+    Outcome of rendering one folder's diagram.
+    """
+
+    folder: str
+    status: str
+    duration: float = 0.0
+    image: str | None = None
+    error: str | None = None
+
+
+def find_diagram_scripts(output_directory):
+    """
+    Finds every generate_diagram.py under the output directory.
+    :return: Sorted list of directories containing a script
+    """
+    return sorted(
+        root for root, _, files in os.walk(output_directory) if DIAGRAM_SCRIPT in files
+    )
+
+
+def render_diagram(directory, timeout=DEFAULT_RENDER_TIMEOUT, output_directory=""):
+    """
+    Runs one generate_diagram.py in its directory.
+    The script gets its own process group so Graphviz children are killed with it
+    on timeout.
+    :param directory: Directory containing generate_diagram.py
+    :param timeout: Seconds before the script is killed
+    :param output_directory: Root the folder name is reported relative to
+    :return: RenderResult
+    """
+    folder = os.path.relpath(directory, output_directory or os.curdir)
+    image = os.path.join(directory, DIAGRAM_IMAGE)
+    if os.path.exists(image):
+        os.remove(image)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, DIAGRAM_SCRIPT],
+        cwd=directory,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    try:
+        _, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        return RenderResult(
+            folder,
+            "timeout",
+            time.perf_counter() - start,
+            error=f"timed out after {timeout}s",
+        )
+    duration = time.perf_counter() - start
+
+    if process.returncode != 0:
+        return RenderResult(
+            folder, "failed", duration, error=stderr[-ERROR_TAIL_CHARS:].strip()
+        )
+    if not os.path.exists(image):
+        return RenderResult(folder, "failed", duration, error=f"no {DIAGRAM_IMAGE}")
+    return RenderResult(folder, "done", duration, image=image)
+
+
+def render_diagrams(
+    output_directory="output", workers=None, timeout=DEFAULT_RENDER_TIMEOUT
+):
+    """
+    Renders every diagram script under the output directory in parallel.
+    Writes render_summary.json next to the folders.
+    :param output_directory: Directory written by generate_docs
+    :param workers: Scripts rendered at the same time, defaults to the CPU count
+    :param timeout: Seconds allowed per script
+    :return: List of RenderResult in folder order
+    """
+    directories = find_diagram_scripts(output_directory)
+    workers = workers or os.cpu_count() or 1
+    logger.info("Rendering %d diagrams with %d workers", len(directories), workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                lambda directory: render_diagram(directory, timeout, output_directory),
+                directories,
+            )
+        )
+
+    for result in results:
+        if result.status == "done":
+            logger.info("%-40s %-8s %6.1fs", result.folder, "done", result.duration)
+        else:
+            logger.error(
+                "%-40s %-8s %6.1fs %s",
+                result.folder,
+                result.status,
+                result.duration,
+                result.error,
+            )
+    failed = sum(1 for r in results if r.status != "done")
+    logger.info("%d diagrams rendered, %d failed", len(results) - failed, failed)
+
+    with open(
+        os.path.join(output_directory, "render_summary.json"), "w", encoding="utf-8"
+    ) as f:
+        json.dump([asdict(r) for r in results], f, indent=2)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render generated diagrams.")
+    parser.add_argument("output_directory", nargs="?", default="output")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Scripts rendered at the same time (default: CPU count)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_RENDER_TIMEOUT,
+        help="Seconds allowed per script (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    results = render_diagrams(args.output_directory, args.workers, args.timeout)
+    return 1 if any(r.status != "done" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Deterministic sharding of a run across several CI runners.
+Folders are assigned to shards by estimated prompt tokens, largest first, each to
+the shard with the least work so far, so every runner computes the same
+assignment from the same tree without coordinating. Each runner writes its own
+manifest; `python sharding.py merge` then combines the documentation and the
+manifests of the shards into one output directory.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+
+from atomic import write_atomic
+from manifest import DEFAULT_MANIFEST, OUTPUT_FILES, manifest_totals
+
+DEFAULT_OUTPUT = os.path.dirname(DEFAULT_MANIFEST)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(spec: str):
+    """
+    Parses "i/N", with shards numbered from 1 to N.
+    :return: Tuple (index, count)
+    """
+    index, sep, count = spec.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        sep = ""
+    if not sep or not 1 <= index <= count:
+        raise ValueError(f"Expected a shard i/N with 1 <= i <= N, got {spec!r}")
+    return index, count
+
+
+def assign_shards(costs, count):
+    """
+    Splits work between shards with the longest-processing-time rule: units are
+    taken from the most to the least expensive and each goes to the shard with
+    the lowest total so far. Ties are broken by name, so the result is stable.
+    :param costs: Dict unit -> estimated cost
+    :param count: Number of shards
+    :return: List of `count` lists of units
+    """
+    loads = [0] * count
+    shards = [[] for _ in range(count)]
+    for unit in sorted(costs, key=lambda unit: (-costs[unit], unit)):
+        index = min(range(count), key=lambda i: (loads[i], i))
+        shards[index].append(unit)
+        loads[index] += costs[unit]
+    return shards
+
+
+def shard_manifest_path(path, index, count):
+    """
+    :return: Manifest path of one shard, e.g. output/manifest.shard-2-of-4.json
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{extension}"
+
+
+def _copy_outputs(directory, destination, folder):
+    source = os.path.join(directory, folder)
+    target = os.path.join(destination, folder)
+    if os.path.abspath(source) != os.path.abspath(target):
+        os.makedirs(target, exist_ok=True)
+        # Files only: nested stack roots have folders of their own.
+        for entry in os.scandir(source):
+            if entry.is_file():
+                shutil.copy2(entry.path, os.path.join(target, entry.name))
+    return [f"{destination}/{folder}/{name}" for name in OUTPUT_FILES]
+
+
+def merge_shards(directories, destination=DEFAULT_OUTPUT):
+    """
+    Combines the output directories of several shards: the documentation of
+    every folder is copied to `destination` and the shard manifests are merged
+    into `destination/manifest.json`, which --resume accepts like any manifest.
+    A folder recorded by several manifests keeps its latest entry.
+    :param directories: Output directories of the shards, with their manifests
+    :param destination: Directory receiving the merged output
+    :return: Merged manifest data
+    """
+    merged_path = os.path.join(destination, os.path.basename(DEFAULT_MANIFEST))
+    folders, shards = {}, []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "manifest*.json"))):
+            if os.path.abspath(path) == os.path.abspath(merged_path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for folder, entry in data.get("folders", {}).items():
+                known = folders.get(folder)
+                if known and known.get("updated", 0) >= entry.get("updated", 0):
+                    continue
+                if entry.get("status") in ("done", "cached"):
+                    entry["outputs"] = _copy_outputs(directory, destination, folder)
+                folders[folder] = entry
+            shards.append(
+                {
+                    "manifest": path,
+                    "shard": data.get("shard"),
+                    "folders": len(data.get("folders", {})),
+                    "started": data.get("started"),
+                    "finished": data.get("finished"),
+                    **manifest_totals(data.get("folders", {}).values()),
+                }
+            )
+    if not shards:
+        raise ValueError(f"No manifest found in {', '.join(directories)}")
+
+    finished = [shard["finished"] for shard in shards]
+    merged = {
+        "started": min(shard["started"] for shard in shards),
+        # Unfinished while any shard is.
+        "finished": None if None in finished else max(finished),
+        "folders": dict(sorted(folders.items())),
+        "totals": manifest_totals(folders.values()),
+        "shards": shards,
+    }
+    write_atomic(merged_path, json.dumps(merged, indent=2))
+    log_merge(merged)
+    logger.info("Merged manifest written to %s", merged_path)
+    return merged
+
+
+def log_merge(merged):
+    """
+    Logs the folders and tokens of a merged run, and how evenly its shards were
+    balanced: the run took as long as its slowest shard.
+    """
+    entries = merged["folders"].values()
+    statuses = {}
+    for entry in entries:
+        statuses[entry.get("status")] = statuses.get(entry.get("status"), 0) + 1
+    logger.info(
+        "%d shards, %d folders: %s",
+        len(merged["shards"]),
+        len(merged["folders"]),
+        ", ".join(f"{count} {status}" for status, count in sorted(statuses.items())),
+    )
+    logger.info(
+        "%d input tokens (%d from prompt cache), %d output tokens",
+        merged["totals"]["input_tokens"],
+        merged["totals"]["cached_tokens"],
+        merged["totals"]["output_tokens"],
+    )
+    durations = []
+    for shard in merged["shards"]:
+        duration = shard["finished"] - shard["started"] if shard["finished"] else None
+        if duration is not None:
+            durations.append(duration)
+        logger.info(
+            "%-12s %5d folders %10d input tokens %s",
+            shard["shard"] or shard["manifest"],
+            shard["folders"],
+            shard["input_tokens"],
+            f"{duration:8.1f}s" if duration is not None else "unfinished",
+        )
+    if durations and max(durations) > 0:
+        logger.info(
+            "Slowest shard %.1fs, %.1fs of work in total, %.0f%% balanced",
+            max(durations),
+            sum(durations),
+            100 * sum(durations) / len(durations) / max(durations),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the outputs of shards.")
+    parser.add_argument("command", choices=["merge"])
+    parser.add_argument(
+        "directories", nargs="+", help="Output directories of the shards"
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    try:
+        merge_shards(args.directories, args.output)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"error: {e}") from None
+
+
+if __name__ == "__main__":
+    main()
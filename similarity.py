@@ -0,0 +1,163 @@
+"""
+Clustering of near-duplicate folders, such as the dev, staging and prod variants
+of one stack.
+Each folder's code is reduced to a bottom-k MinHash sketch of its token shingles;
+folders whose estimated Jaccard similarity reaches the threshold are grouped, and
+the member most similar to the others represents the group.
+"""
+
+import difflib
+import hashlib
+import heapq
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+DEFAULT_VARIANT_THRESHOLD = 0.85
+SKETCH_SIZE = 128
+SHINGLE_SIZE = 5
+DIFF_CONTEXT = 1
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def _hash(shingle):
+    digest = hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def sketch(code: str, size: int = SKETCH_SIZE, shingle: int = SHINGLE_SIZE):
+    """
+    Bottom-k MinHash sketch of the token shingles of a text.
+    Shingles are hashed with a fixed function, so the same folders form the same
+    clusters, with the same representative, from one run to the next.
+    :return: Frozenset of the `size` smallest shingle hashes
+    """
+    tokens = TOKEN.findall(code)
+    shingles = {
+        " ".join(tokens[i : i + shingle])
+        for i in range(max(len(tokens) - shingle + 1, 1))
+    }
+    return frozenset(heapq.nsmallest(size, {_hash(s) for s in shingles}))
+
+
+def similarity(a, b, size: int = SKETCH_SIZE) -> float:
+    """
+    Estimates the Jaccard similarity of two texts from their sketches.
+    """
+    if not a or not b:
+        return 0.0
+    union = heapq.nsmallest(size, a | b)
+    return sum(1 for h in union if h in a and h in b) / len(union)
+
+
+@dataclass
+class Cluster:
+    """
+    Near-duplicate folders documented from one representative.
+    :param representative: Folder documented in full
+    :param variants: Other folders, mapped to their similarity to the representative
+    """
+
+    representative: str
+    variants: dict = field(default_factory=dict)
+
+
+def cluster_folders(codes, threshold=DEFAULT_VARIANT_THRESHOLD):
+    """
+    Groups the folders whose code is at least `threshold` similar.
+    :param codes: Dict folder -> collected code
+    :param threshold: Minimum estimated Jaccard similarity, between 0 and 1
+    :return: List of Cluster of two folders or more, in folder order
+    """
+    return cluster_sketches(
+        {folder: sketch(code) for folder, code in codes.items() if code.strip()},
+        threshold,
+    )
+
+
+def cluster_sketches(sketches, threshold=DEFAULT_VARIANT_THRESHOLD):
+    """
+    Groups the folders whose sketches are at least `threshold` similar, so
+    the code of every folder need not be kept until all are collected.
+    Candidate pairs are the folders sharing enough sketch values, so unrelated
+    folders are never compared.
+    :param sketches: Dict folder -> sketch of its code, see sketch
+    :param threshold: Minimum estimated Jaccard similarity, between 0 and 1
+    :return: List of Cluster of two folders or more, in folder order
+    """
+    index = {}
+    for folder, values in sketches.items():
+        for value in values:
+            index.setdefault(value, []).append(folder)
+
+    parent = {folder: folder for folder in sketches}
+
+    def find(folder):
+        while parent[folder] != folder:
+            parent[folder] = parent[parent[folder]]
+            folder = parent[folder]
+        return folder
+
+    scores = {}
+    for folder, values in sketches.items():
+        shared = Counter(
+            other for value in values for other in index[value] if other > folder
+        )
+        for other, count in shared.items():
+            # Two sketches at similarity s share at least about s * size values,
+            # where small folders have fewer values than SKETCH_SIZE.
+            size = min(len(values), len(sketches[other]), SKETCH_SIZE)
+            if count < threshold * size / 2:
+                continue
+            score = similarity(values, sketches[other])
+            if score >= threshold:
+                scores[folder, other] = scores[other, folder] = score
+                parent[find(other)] = find(folder)
+
+    groups = {}
+    for folder in sorted(sketches):
+        groups.setdefault(find(folder), []).append(folder)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+
+        def closeness(folder, members=members):
+            return sum(
+                scores.get((folder, other))
+                or similarity(sketches[folder], sketches[other])
+                for other in members
+                if other != folder
+            )
+
+        representative = max(members, key=lambda folder: (closeness(folder), folder))
+        cluster = Cluster(representative)
+        for folder in members:
+            if folder == representative:
+                continue
+            score = scores.get((representative, folder)) or similarity(
+                sketches[representative], sketches[folder]
+            )
+            # Chained through other members but too far from the representative.
+            if score >= threshold:
+                cluster.variants[folder] = round(score, 3)
+        if cluster.variants:
+            clusters.append(cluster)
+    return sorted(clusters, key=lambda cluster: cluster.representative)
+
+
+def code_diff(base_code, code, base_name, name):
+    """
+    :return: Unified diff turning the base folder's code into the folder's code
+    """
+    return "".join(
+        difflib.unified_diff(
+            base_code.splitlines(keepends=True),
+            code.splitlines(keepends=True),
+            fromfile=base_name,
+            tofile=name,
+            n=DIFF_CONTEXT,
+        )
+    )
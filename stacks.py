@@ -0,0 +1,173 @@
+"""
+Discovery of the stack roots of a repository, at any depth.
+A stack root is a directory with a Terraform `provider` or `backend` block, a
+`cdk.json` or a `terragrunt.hcl`; it owns the infrastructure files below it, down
+to the next stack root. Top-level directories without any stack root inside are
+kept as stacks of their own, as they were before discovery.
+The layout is saved in an index with the modification times of the directories
+walked and of the files that decide it. A later run only stats them, and walks
+the tree again, reading only the files that changed, when one of them differs.
+"""
+
+import json
+import logging
+import os
+import posixpath
+import re
+import time
+
+from atomic import write_atomic
+from collector import INFRA_EXTENSIONS, FileCollector
+from tracing import span
+
+MARKER_FILES = ("cdk.json", "terragrunt.hcl")
+ROOT_BLOCK = re.compile(r'^\s*(?:provider|backend)\s+"[^"]*"\s*\{', re.MULTILINE)
+STACK_INDEX_FILE = "stacks.json"
+INDEX_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def _relative(path, base):
+    return os.path.relpath(path, base).replace(os.sep, "/")
+
+
+def _has_root_block(path, max_bytes):
+    try:
+        if os.path.getsize(path) > max_bytes:
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            return ROOT_BLOCK.search(f.read()) is not None
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def _scan(base, collector, known):
+    """
+    Walks the tree and records the files that decide its layout.
+    :param known: Files of the previous index; .tf files with the same
+        modification time and size are not read again
+    :return: Tuple (directories: path -> mtime_ns, files: path -> [mtime_ns,
+        size, is_marker], number of files read)
+    """
+    directories, files, read = {}, {}, 0
+    for current, _, entries in collector.walk(base):
+        directories[_relative(current, base)] = os.stat(current).st_mtime_ns
+        for entry in entries:
+            name = entry.name
+            if not (
+                name.endswith(INFRA_EXTENSIONS)
+                or name in MARKER_FILES
+                or name in collector.ignore_files
+            ):
+                continue
+            path = _relative(entry.path, base)
+            stat = entry.stat()
+            marker = name in MARKER_FILES
+            if name.endswith(".tf"):
+                previous = known.get(path)
+                if previous and previous[:2] == [stat.st_mtime_ns, stat.st_size]:
+                    marker = previous[2]
+                else:
+                    marker = _has_root_block(entry.path, collector.max_file_bytes)
+                    read += 1
+            files[path] = [stat.st_mtime_ns, stat.st_size, marker]
+    return directories, files, read
+
+
+def _roots(files):
+    """
+    :return: Dict stack root -> sorted infrastructure files it owns; roots
+        without files of their own, such as a Terragrunt parent configuration,
+        are left out
+    """
+    marked = {
+        posixpath.dirname(path) for path, (_, _, marker) in files.items() if marker
+    }
+    # The base directory itself is never documented as a folder.
+    marked.discard("")
+    owned, loose = {}, {}
+    for path in sorted(files):
+        if not path.endswith(INFRA_EXTENSIONS):
+            continue
+        directory = posixpath.dirname(path)
+        while directory and directory not in marked:
+            directory = posixpath.dirname(directory)
+        if directory:
+            owned.setdefault(directory, []).append(path)
+        elif "/" in path:
+            loose.setdefault(path.partition("/")[0], []).append(path)
+    for top_level, paths in loose.items():
+        if not any(
+            root == top_level or root.startswith(top_level + "/") for root in marked
+        ):
+            owned[top_level] = paths
+    return dict(sorted(owned.items()))
+
+
+def _unchanged(entry, base):
+    try:
+        return all(
+            os.stat(os.path.join(base, path)).st_mtime_ns == mtime
+            for path, mtime in entry["directories"].items()
+        ) and all(
+            [(stat := os.stat(os.path.join(base, path))).st_mtime_ns, stat.st_size]
+            == [mtime, size]
+            for path, (mtime, size, _) in entry["files"].items()
+        )
+    except OSError:
+        return False
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return index if index.get("version") == INDEX_VERSION else {}
+
+
+def discover_stacks(base_directory, collector=None, index_path=None):
+    """
+    Finds the stack roots of a repository.
+    :param base_directory: Base directory where the repository is located
+    :param collector: FileCollector with the ignore rules to apply
+    :param index_path: JSON index reused and updated from one run to the next,
+        None to walk the tree every time
+    :return: Dict stack root, relative to base_directory with "/" separators ->
+        sorted paths of its infrastructure files
+    """
+    collector = collector or FileCollector()
+    base = os.path.abspath(base_directory)
+    settings = [list(collector.ignore_files), collector.max_file_bytes]
+    started = time.perf_counter()
+    with span("discover") as discover_span:
+        index = _load(index_path) if index_path else {}
+        entry = index.get("bases", {}).get(base)
+        if entry and entry["settings"] == settings and _unchanged(entry, base):
+            roots = entry["roots"]
+            how = "index reused"
+        else:
+            directories, files, read = _scan(
+                base, collector, entry["files"] if entry else {}
+            )
+            roots = _roots(files)
+            how = f"{len(directories)} directories walked, {read} files read"
+            if index_path:
+                index["version"] = INDEX_VERSION
+                index.setdefault("bases", {})[base] = {
+                    "settings": settings,
+                    "directories": directories,
+                    "files": files,
+                    "roots": roots,
+                }
+                write_atomic(index_path, json.dumps(index))
+        discover_span.set(roots=len(roots), reused=how == "index reused")
+    logger.info(
+        "%d stack roots found in %.0fms (%s)",
+        len(roots),
+        (time.perf_counter() - started) * 1000,
+        how,
+    )
+    return roots
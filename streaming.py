@@ -0,0 +1,235 @@
+"""
+Streaming of documentation responses.
+The `readme` and `diagram_code` fields of the JSON response are decoded while the
+tokens arrive and written to the folder's output files, progress is logged, and a
+stream that stops producing tokens is aborted instead of waiting for the timeout.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack
+
+from tokens import count_tokens
+
+DEFAULT_STALL_TIMEOUT = 30.0
+PROGRESS_INTERVAL = 5.0
+FIELD_FILES = {"readme": "README.md", "diagram_code": "generate_diagram.py"}
+ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class StreamStalled(ConnectionError):
+    """
+    Raised when no token arrives within the stall timeout. Treated like a dropped
+    connection, so the request is retried rather than the folder timed out.
+    """
+
+
+class StreamCancelled(Exception):
+    """
+    Raised when the folder being streamed was abandoned after its timeout, so
+    its output files are not written any further.
+    """
+
+
+class JsonFieldRouter:
+    """
+    Incrementally decodes the string fields of a flat JSON object and passes
+    their text to `on_text(field, text)` as soon as it is received.
+    """
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.state = "outside"
+        self.key = ""
+        self.field = None
+        self.escape = None
+        self.high_surrogate = None
+
+    def _decode_escape(self):
+        if self.escape[0] != "u":
+            return ESCAPES.get(self.escape[0], self.escape[0])
+        if len(self.escape) < 5:
+            return None
+        code = int(self.escape[1:5], 16)
+        if 0xD800 <= code < 0xDC00:
+            self.high_surrogate = code
+            return ""
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + code - 0xDC00
+        self.high_surrogate = None
+        return chr(code)
+
+    def feed(self, text):
+        decoded = []
+        for char in text:
+            if self.state == "value":
+                if self.escape is not None:
+                    self.escape += char
+                    value = self._decode_escape()
+                    if value is not None:
+                        decoded.append(value)
+                        self.escape = None
+                elif char == "\\":
+                    self.escape = ""
+                elif char == '"':
+                    self._flush(decoded)
+                    self.state, self.field = "outside", None
+                else:
+                    decoded.append(char)
+            elif self.state == "key":
+                if char == '"':
+                    self.state = "colon"
+                else:
+                    self.key += char
+            elif self.state == "colon":
+                if char == '"':
+                    self.state, self.field = "value", self.key
+                elif char not in " \t\r\n:":
+                    # Not a string value (number, object...): nothing to route.
+                    self.state = "outside"
+            elif char == '"':
+                self.state, self.key = "key", ""
+        self._flush(decoded)
+
+    def _flush(self, decoded):
+        if decoded and self.field:
+            self.on_text(self.field, "".join(decoded))
+        decoded.clear()
+
+
+_END = object()
+
+
+def _watch(chunks, stall_timeout):
+    # The stream is read in a helper thread so that a stalled read can be
+    # abandoned; the HTTP client timeout eventually releases the thread.
+    items = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                items.put((chunk, None))
+            items.put((_END, None))
+        except Exception as e:  # noqa: BLE001 - re-raised by the consumer
+            items.put((None, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        try:
+            chunk, error = items.get(timeout=stall_timeout)
+        except queue.Empty:
+            raise StreamStalled(f"no token for {stall_timeout}s") from None
+        if error is not None:
+            raise error
+        if chunk is _END:
+            return
+        yield chunk
+
+
+class DocumentationStream:
+    """
+    Consumes a streamed documentation response for one folder, writing the README
+    and the diagram code under output/<folder>/ as they arrive.
+    :param infra_folder: Folder being documented
+    :param stall_timeout: Seconds without a token after which the stream is aborted
+    :param cancelled: threading.Event set when the folder is abandoned, None if
+        it never is
+    :param model: Model whose tokenizer counts the streamed tokens until the
+        response reports its usage
+    """
+
+    def __init__(
+        self,
+        infra_folder,
+        stall_timeout=DEFAULT_STALL_TIMEOUT,
+        cancelled=None,
+        model="gpt-4o",
+    ):
+        self.infra_folder = infra_folder
+        self.stall_timeout = stall_timeout
+        self.cancelled = cancelled
+        self.model = model
+        self.first_token = None
+        self.tokens = 0
+        self.duration = 0.0
+
+    @property
+    def tokens_per_second(self):
+        generating = self.duration - (self.first_token or 0.0)
+        return self.tokens / generating if generating > 0 else 0.0
+
+    def consume(self, chunks):
+        """
+        Reads a stream of message chunks to its end.
+        :param chunks: Iterator of AIMessageChunk, e.g. from `llm.stream(messages)`
+        :return: The aggregated message
+        :raises StreamStalled: When no chunk arrives within the stall timeout
+        """
+        directory = f"output/{self.infra_folder}"
+        files = {}
+        message = None
+        start = last_progress = time.perf_counter()
+        self.first_token, self.tokens = None, 0
+        with ExitStack() as stack:
+
+            def write(field, text):
+                if field not in FIELD_FILES:
+                    return
+                if field not in files:
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(directory, FIELD_FILES[field])
+                    files[field] = stack.enter_context(
+                        open(path, "w", encoding="utf-8")
+                    )
+                files[field].write(text)
+                files[field].flush()
+
+            router = JsonFieldRouter(write)
+            for chunk in _watch(chunks, self.stall_timeout):
+                if self.cancelled is not None and self.cancelled.is_set():
+                    raise StreamCancelled(f"{self.infra_folder} was abandoned")
+                message = chunk if message is None else message + chunk
+                if not chunk.content:
+                    continue
+                now = time.perf_counter()
+                if self.first_token is None:
+                    self.first_token = now - start
+                    logger.info(
+                        "First token for %s after %.1fs",
+                        self.infra_folder,
+                        self.first_token,
+                    )
+                self.tokens += count_tokens(chunk.content, self.model)
+                router.feed(chunk.content)
+                self.duration = now - start
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    logger.info(
+                        "Streaming %s: %d tokens, %.1f tokens/s",
+                        self.infra_folder,
+                        self.tokens,
+                        self.tokens_per_second,
+                    )
+        self.duration = time.perf_counter() - start
+        if message is None:
+            from langchain_core.messages import AIMessageChunk
+
+            message = AIMessageChunk(content="")
+        usage = getattr(message, "usage_metadata", None)
+        if usage and usage.get("output_tokens"):
+            self.tokens = usage["output_tokens"]
+        return message
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the parts of the GitHub API read by remote.py: commits with
+ETags, recursive trees, blobs and tarballs. The commit SHA follows the files, so
+changing `files` between two snapshots publishes a new commit.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from remote import git_blob_sha
+
+
+class FakeGitHubServer:
+    """
+    :param files: Dict path -> content of the repository's default branch
+    :param full_name: "owner/name" served
+    """
+
+    def __init__(self, files, full_name="acme/infra"):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                with server.lock:
+                    server.requests.append(path)
+                prefix = f"/repos/{server.full_name}"
+                if path == prefix:
+                    self._send_json({"full_name": server.full_name, "url": server.url})
+                elif path.startswith(f"{prefix}/commits/"):
+                    self._commit()
+                elif path.startswith(f"{prefix}/git/trees/"):
+                    self._send_json(
+                        {
+                            "sha": server.commit,
+                            "truncated": False,
+                            "tree": [
+                                {
+                                    "path": name,
+                                    "mode": "100644",
+                                    "type": "blob",
+                                    "sha": git_blob_sha(data),
+                                    "size": len(data),
+                                }
+                                for name, data in server.files.items()
+                            ],
+                        }
+                    )
+                elif path.startswith(f"{prefix}/git/blobs/"):
+                    sha = path.rsplit("/", 1)[1]
+                    data = server.blobs[sha]
+                    self._send_json(
+                        {
+                            "sha": sha,
+                            "size": len(data),
+                            "encoding": "base64",
+                            "content": base64.b64encode(data).decode(),
+                        }
+                    )
+                elif path.startswith(f"{prefix}/tarball/"):
+                    # Like GitHub, the API redirects to the archive.
+                    self.send_response(302)
+                    self.send_header("Location", f"{server.root}/archive.tar.gz")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif path == "/archive.tar.gz":
+                    self._send(server.archive(), "application/gzip")
+                else:
+                    self._send_json({"message": "Not Found"}, 404)
+
+            def _commit(self):
+                etag = f'"{server.commit}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self._send_json({"sha": server.commit}, headers={"ETag": etag})
+
+            def _send_json(self, data, status=200, headers=None):
+                self._send(json.dumps(data).encode(), status=status, headers=headers)
+
+            def _send(
+                self, body, content_type="application/json", status=200, headers=None
+            ):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.files = dict(files)
+        self.full_name = full_name
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.root = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.url = f"{self.root}/repos/{full_name}"
+
+    @property
+    def commit(self):
+        digest = hashlib.sha1()
+        for name, data in sorted(self.files.items()):
+            digest.update(name.encode() + b"\0" + git_blob_sha(data).encode())
+        return digest.hexdigest()
+
+    @property
+    def blobs(self):
+        return {git_blob_sha(data): data for data in self.files.values()}
+
+    def archive(self):
+        buffer = io.BytesIO()
+        prefix = f"{self.full_name.replace('/', '-')}-{self.commit[:7]}"
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            for name, data in self.files.items():
+                member = tarfile.TarInfo(f"{prefix}/{name}")
+                member.size, member.mtime = len(data), int(time.time())
+                tar.addfile(member, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def calls(self, kind):
+        """
+        :return: Number of requests received for one kind of endpoint, e.g. "blobs"
+        """
+        with self.lock:
+            return sum(f"/{kind}/" in path for path in self.requests)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
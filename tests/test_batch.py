@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import generate_docs
+from backends import create_backend
+from batch import parse_results
+from benchmark import FakeModelServer
+
+
+def bucket(name):
+    return f'resource "aws_s3_bucket" "{name}" {{\n  bucket = "{name}"\n}}\n\n'
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    # run_batch writes under output/ in the working directory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    for folder, code in {
+        "app": bucket("app"),
+        "broken": bucket("broken"),
+        "invalid": bucket("invalid"),
+        "big": "".join(bucket(f"big-{i}") for i in range(200)),
+    }.items():
+        (tmp_path / "repo" / folder).mkdir(parents=True)
+        (tmp_path / "repo" / folder / "main.tf").write_text(code)
+    return tmp_path
+
+
+def test_parse_results_demultiplexes_by_custom_id():
+    output = "\n".join(
+        json.dumps(
+            {
+                "custom_id": folder,
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{"message": {"content": f"reply {folder}"}}],
+                        "usage": {"prompt_tokens": 3},
+                    },
+                },
+            }
+        )
+        for folder in ("b", "a")
+    )
+    error = json.dumps(
+        {
+            "custom_id": "c",
+            "response": {"status_code": 400, "body": {"error": {"message": "no"}}},
+        }
+    )
+    results = parse_results(output, error)
+    assert results["a"]["content"] == "reply a"
+    assert results["b"]["usage"] == {"prompt_tokens": 3}
+    assert json.loads(results["c"]["error"]) == {"message": "no"}
+
+
+def test_run_batch_against_stand_in(repo):
+    with FakeModelServer(
+        ttft=0, output_tokens=0, failing={"broken"}, invalid_diagrams={"invalid"}
+    ) as server:
+        results = generate_docs.run_batch(
+            "repo",
+            poll_interval=0,
+            backend=create_backend("openai", "gpt-4o", base_url=server.url),
+            token_budget=500,
+            base_url=server.url,
+        )
+    by_folder = {result.folder: result for result in results}
+    assert [result.folder for result in results] == ["app", "big", "broken", "invalid"]
+    assert {folder: r.status for folder, r in by_folder.items()} == {
+        "app": "done",
+        "big": "done",
+        "broken": "failed",
+        "invalid": "done",
+    }
+
+    # Each answer is written to the folder named by its custom_id.
+    assert (repo / "output/app/README.md").read_text().startswith("# app")
+    assert "broken was rejected" in by_folder["broken"].error
+    assert not (repo / "output/broken").exists()
+
+    # The oversized folder is submitted as the summaries of its chunks.
+    with open(repo / "output/batch_requests.jsonl", encoding="utf-8") as f:
+        submitted = {
+            request["custom_id"]: request["body"]["messages"][-1]["content"]
+            for request in map(json.loads, f)
+        }
+    assert "summarised in" in submitted["big"]
+    assert 'bucket = "big-199"' not in submitted["big"]
+    assert "summarised in" not in submitted["app"]
+
+    # The invalid diagram is repaired through direct calls.
+    assert by_folder["invalid"].repairs == 1
+    assert by_folder["invalid"].error is None
+    diagram = (repo / "output/invalid/generate_diagram.py").read_text()
+    assert "diagrams.aws.unknown" not in diagram
@@ -0,0 +1,17 @@
+import os
+
+from cache import ResponseCache
+
+
+def test_hit_survives_eviction_after_the_read(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("key", "# readme", "diagram")
+
+    def evicted(path, *args, **kwargs):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    entry = cache.get("key")
+    assert (entry["readme"], entry["diagram_code"]) == ("# readme", "diagram")
+    assert cache.get("key") is None
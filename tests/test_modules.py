@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from modules import ModuleRegistry
+
+
+class OwnerCancelled(Exception):
+    pass
+
+
+def test_waiter_describes_module_when_owner_fails(tmp_path):
+    module = tmp_path / "modules" / "vpc"
+    module.mkdir(parents=True)
+    (module / "main.tf").write_text('resource "aws_vpc" "main" {}\n')
+    registry = ModuleRegistry()
+    owner_called, release = threading.Event(), threading.Event()
+
+    def failing_invoke(messages):
+        owner_called.set()
+        release.wait(5)
+        raise OwnerCancelled("app-dev timed out, its output is discarded")
+
+    def invoke(messages):
+        return AIMessage(content="VPC with one subnet")
+
+    errors = []
+
+    def owner():
+        try:
+            registry.describe(str(module), failing_invoke, "gpt-4o")
+        except OwnerCancelled as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    assert owner_called.wait(5)
+    results = []
+    waiter = threading.Thread(
+        target=lambda: results.append(registry.describe(str(module), invoke, "gpt-4o"))
+    )
+    waiter.start()
+    # Released once the waiter is blocked on the owner's description.
+    while registry.references < 2:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+
+    assert len(errors) == 1
+    _, description, usage = results[0]
+    assert description == "VPC with one subnet"
+    assert usage != (0, 0, 0)
+    assert registry.generated == 1
+
+
+def test_owner_error_is_raised_to_owner_only(tmp_path):
+    (tmp_path / "main.tf").write_text('resource "aws_vpc" "main" {}\n')
+    registry = ModuleRegistry()
+
+    def failing_invoke(messages):
+        raise OwnerCancelled("abandoned")
+
+    with pytest.raises(OwnerCancelled):
+        registry.describe(str(tmp_path), failing_invoke, "gpt-4o")
+    _, description, _ = registry.describe(
+        str(tmp_path), lambda messages: AIMessage(content="described"), "gpt-4o"
+    )
+    assert description == "described"
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+from fake_github import FakeGitHubServer
+from github import Auth, Github
+
+from remote import BlobStore, RemoteRepository, fetch_repositories, git_blob_sha
+
+FILES = {
+    "network/main.tf": b'provider "aws" {}\nresource "aws_vpc" "main" {}\n',
+    "network/.gitignore": b"generated.tf\n",
+    "app/main.tf": b'provider "aws" {}\nresource "aws_lambda_function" "api" {}\n',
+    "app/stack.ts": b"export class App {}\n",
+    "app/node_modules/lib/index.ts": b"export {};\n",
+    "README.md": b"# infra\n",
+}
+
+
+@pytest.fixture
+def github(monkeypatch):
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    with FakeGitHubServer(FILES) as server:
+        yield server
+
+
+def client(server):
+    return Github(auth=Auth.Token("test"), base_url=server.root, lazy=True)
+
+
+def repository(server, tmp_path, **kwargs):
+    return RemoteRepository(
+        client(server), server.full_name, directory=str(tmp_path / "remote"), **kwargs
+    )
+
+
+def test_snapshot_lays_out_infrastructure_files(github, tmp_path):
+    root, folders, [stats] = fetch_repositories(
+        client(github), [github.full_name], str(tmp_path / "remote")
+    )
+    destination = os.path.join(root, "acme", "infra")
+    assert folders == ["acme/infra/app", "acme/infra/network"]
+    with open(os.path.join(destination, "network", "main.tf"), "rb") as f:
+        assert f.read() == FILES["network/main.tf"]
+    assert os.path.exists(os.path.join(destination, "network", ".gitignore"))
+    assert not os.path.exists(os.path.join(destination, "README.md"))
+    assert not os.path.exists(os.path.join(destination, "app", "node_modules"))
+    assert (stats.files, stats.downloaded, stats.cached) == (4, 4, 0)
+    assert not stats.archive and not stats.ref_cached
+
+
+def test_unchanged_ref_is_answered_with_304(github, tmp_path):
+    repository(github, tmp_path).snapshot(str(tmp_path / "first"))
+    blobs, trees = github.calls("blobs"), github.calls("trees")
+
+    stats = repository(github, tmp_path).snapshot(str(tmp_path / "second"))
+    assert stats.ref_cached
+    assert (stats.downloaded, stats.cached) == (0, 4)
+    # Neither the tree of the commit nor any blob is requested again.
+    assert (github.calls("blobs"), github.calls("trees")) == (blobs, trees)
+    assert (tmp_path / "second" / "app" / "stack.ts").read_bytes() == FILES[
+        "app/stack.ts"
+    ]
+
+
+def test_changed_file_downloads_only_its_blob(github, tmp_path):
+    repository(github, tmp_path).snapshot(str(tmp_path / "snapshot"))
+    blobs = github.calls("blobs")
+    changed = b'provider "aws" {}\nresource "aws_vpc" "main" { cidr_block = "x" }\n'
+    github.files["network/main.tf"] = changed
+
+    stats = repository(github, tmp_path).snapshot(str(tmp_path / "snapshot"))
+    assert not stats.ref_cached
+    assert (stats.downloaded, stats.cached) == (1, 3)
+    assert github.calls("blobs") == blobs + 1
+    assert (tmp_path / "snapshot" / "network" / "main.tf").read_bytes() == changed
+
+
+def test_many_missing_blobs_come_from_the_tarball(github, tmp_path):
+    stats = repository(github, tmp_path, archive_threshold=2).snapshot(
+        str(tmp_path / "snapshot")
+    )
+    assert stats.archive
+    assert github.calls("tarball") == 1
+    assert github.calls("blobs") == 0
+    assert (tmp_path / "snapshot" / "app" / "main.tf").read_bytes() == FILES[
+        "app/main.tf"
+    ]
+
+
+def test_few_missing_blobs_are_fetched_one_by_one(github, tmp_path):
+    stats = repository(github, tmp_path, archive_threshold=10).snapshot(
+        str(tmp_path / "snapshot")
+    )
+    assert not stats.archive
+    assert github.calls("tarball") == 0
+    assert github.calls("blobs") == 4
+
+
+def test_blob_store_rejects_content_not_matching_its_sha(tmp_path):
+    store = BlobStore(str(tmp_path))
+    store.put(git_blob_sha(b"data"), b"data")
+    assert git_blob_sha(b"data") in store
+    with pytest.raises(ValueError, match="does not match"):
+        store.put(git_blob_sha(b"data"), b"other")
+
+
+@pytest.mark.parametrize("path", ["../evil.tf", "../infra-evil/main.tf"])
+def test_paths_outside_the_snapshot_are_rejected(github, tmp_path, path):
+    github.files[path] = b'resource "aws_vpc" "evil" {}\n'
+    destination = tmp_path / "checkouts" / "infra"
+    with pytest.raises(ValueError, match="Unsafe path"):
+        repository(github, tmp_path).snapshot(str(destination))
+    assert not (tmp_path / "checkouts" / "infra-evil").exists()
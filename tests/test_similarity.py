@@ -0,0 +1,20 @@
+from similarity import cluster_folders, sketch
+
+SMALL_STACK = """resource "aws_sqs_queue" "jobs" {
+  name                      = "jobs"
+  message_retention_seconds = 86400
+}
+"""
+
+
+def test_identical_small_folders_cluster():
+    assert len(sketch(SMALL_STACK)) < 64
+    clusters = cluster_folders({"app-dev": SMALL_STACK, "app-prod": SMALL_STACK})
+    assert len(clusters) == 1
+    assert clusters[0].representative == "app-prod"
+    assert clusters[0].variants == {"app-dev": 1.0}
+
+
+def test_unrelated_folders_do_not_cluster():
+    other = 'resource "aws_vpc" "main" {\n  cidr_block = "10.0.0.0/16"\n}\n'
+    assert cluster_folders({"queue": SMALL_STACK, "network": other}) == []
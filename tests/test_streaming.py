@@ -0,0 +1,35 @@
+import json
+
+from langchain_core.messages import AIMessageChunk
+
+from streaming import DocumentationStream
+from tokens import count_tokens
+
+REPLY = json.dumps(
+    {"readme": "# app\n\nA queue and the function consuming it.", "diagram_code": ""}
+)
+
+
+def chunks(size, usage=None):
+    pieces = [REPLY[i : i + size] for i in range(0, len(REPLY), size)]
+    for piece in pieces:
+        yield AIMessageChunk(content=piece)
+    if usage:
+        yield AIMessageChunk(content="", usage_metadata=usage)
+
+
+def test_counts_tokens_not_chunks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stream = DocumentationStream("app")
+    stream.consume(chunks(40))
+    assert stream.tokens == count_tokens(REPLY)
+    assert stream.tokens > len(REPLY) // 40 + 1
+    assert (tmp_path / "output/app/README.md").read_text().startswith("# app")
+
+
+def test_reported_usage_is_preferred(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stream = DocumentationStream("app")
+    usage = {"input_tokens": 100, "output_tokens": 17, "total_tokens": 117}
+    stream.consume(chunks(40, usage))
+    assert stream.tokens == 17
@@ -0,0 +1,210 @@
+"""
+Compact Terraform resource graph used as prompt payload instead of raw HCL.
+Only block types, names, a few attributes that matter for diagrams and the
+references between blocks are kept; tags, comments and policy documents are dropped.
+"""
+
+import re
+
+from collector import FILE_HEADER, CollectionStats, FileCollector
+
+GRAPH_HEADER = (
+    "# Terraform resource graph: one block per line as `kind type.name`,"
+    " key attributes in brackets and the blocks it references after `->`."
+    " Other attributes, tags and comments are omitted."
+)
+
+# Attributes kept because they change how a resource is drawn or named.
+KEY_ATTRIBUTES = (
+    "source",
+    "version",
+    "name",
+    "engine",
+    "runtime",
+    "instance_type",
+    "cidr_block",
+    "map_public_ip_on_launch",
+    "internal",
+    "load_balancer_type",
+    "type",
+)
+
+BLOCK_HEADER = re.compile(
+    r'([A-Za-z_][\w-]*)((?:[ \t]+(?:"[^"\n]*"|[A-Za-z_][\w-]*))*)[ \t]*\{'
+)
+LABEL = re.compile(r'"([^"\n]*)"|([A-Za-z_][\w-]*)')
+HEREDOC = re.compile(r"<<-?([A-Za-z_]\w*)\n")
+
+REFERENCE_PATTERNS = (
+    (re.compile(r"(?<![\w.])data\.([\w-]+)\.([\w-]+)"), "data.{0}.{1}"),
+    (re.compile(r"(?<![\w.])module\.([\w-]+)"), "module.{0}"),
+    (re.compile(r"(?<![\w.])var\.([\w-]+)"), "var.{0}"),
+    (re.compile(r"(?<![\w.])local\.([\w-]+)"), "local.{0}"),
+)
+RESOURCE_REFERENCE = re.compile(r"(?<![\w.])([a-z][a-z0-9]*_[\w]+)\.([A-Za-z_][\w-]*)")
+
+
+def _skip_string(text, i):
+    # `i` is just after the opening quote; interpolations may nest strings.
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            i += 2
+        elif char == '"':
+            return i + 1
+        elif text.startswith("${", i):
+            i = _skip_braces(text, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _skip_braces(text, i, depth=1):
+    # `i` is just after an opening brace; returns the index after its match.
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            i = _skip_string(text, i + 1)
+            continue
+        if char == "#" or text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end == -1 else end
+            continue
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        heredoc = HEREDOC.match(text, i) if char == "<" else None
+        if heredoc:
+            terminator = re.compile(rf"^[ \t]*{heredoc.group(1)}[ \t]*$", re.MULTILINE)
+            end = terminator.search(text, heredoc.end())
+            i = len(text) if end is None else end.end()
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def parse_blocks(hcl: str):
+    """
+    Splits HCL into its top-level blocks.
+    :param hcl: Content of a .tf file
+    :return: List of (block type, labels, body)
+    """
+    blocks = []
+    i = 0
+    while i < len(hcl):
+        char = hcl[i]
+        if char in " \t\r\n":
+            i += 1
+        elif char == "#" or hcl.startswith("//", i):
+            end = hcl.find("\n", i)
+            i = len(hcl) if end == -1 else end + 1
+        elif hcl.startswith("/*", i):
+            end = hcl.find("*/", i + 2)
+            i = len(hcl) if end == -1 else end + 2
+        else:
+            header = BLOCK_HEADER.match(hcl, i)
+            if not header:
+                # Top-level attribute (e.g. in .tfvars-like files): skip the line.
+                end = hcl.find("\n", i)
+                i = len(hcl) if end == -1 else end + 1
+                continue
+            end = _skip_braces(hcl, header.end())
+            labels = [quoted or bare for quoted, bare in LABEL.findall(header.group(2))]
+            blocks.append((header.group(1), labels, hcl[header.end() : end - 1]))
+            i = end
+    return blocks
+
+
+def _attributes(body):
+    attributes = []
+    for name in KEY_ATTRIBUTES:
+        match = re.search(
+            rf'^[ \t]*{name}[ \t]*=[ \t]*("[^"\n]*"|[\w.\-]+)[ \t]*$',
+            body,
+            re.MULTILINE,
+        )
+        if match:
+            value = match.group(1).strip('"')
+            attributes.append(f"{name}={value}")
+    return attributes
+
+
+def _references(body, resource_types, own):
+    references = set()
+    for pattern, template in REFERENCE_PATTERNS:
+        for match in pattern.finditer(body):
+            references.add(template.format(*match.groups()))
+    for resource_type, name in RESOURCE_REFERENCE.findall(body):
+        if resource_type in resource_types:
+            references.add(f"{resource_type}.{name}")
+    references.discard(own)
+    return sorted(references)
+
+
+def _reference_prefix(kind):
+    # How other blocks refer to a block of this kind, e.g. `module.vpc`.
+    return {"data": "data.", "module": "module.", "variable": "var."}.get(kind, "")
+
+
+def build_graph(files):
+    """
+    Builds the resource graph of a folder.
+    :param files: Iterable of (path, HCL content)
+    :return: Sorted list of (kind, address, attributes, references)
+    """
+    blocks = [block for _, hcl in files for block in parse_blocks(hcl)]
+    resource_types = {
+        labels[0] for kind, labels, _ in blocks if kind == "resource" and labels
+    }
+    graph = []
+    for kind, labels, body in blocks:
+        address = ".".join(labels)
+        own = _reference_prefix(kind) + address
+        graph.append(
+            (kind, address, _attributes(body), _references(body, resource_types, own))
+        )
+    return sorted(graph)
+
+
+def serialise_graph(graph) -> str:
+    """
+    Renders a graph built by build_graph, one block per line.
+    """
+    lines = [GRAPH_HEADER]
+    for kind, address, attributes, references in graph:
+        line = f"{kind} {address}".rstrip()
+        if attributes:
+            line += f" [{', '.join(attributes)}]"
+        if references:
+            line += f" -> {', '.join(references)}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def graph_payload(directory, collector=None, exclude=()):
+    """
+    Collects a folder with its Terraform files reduced to a resource graph.
+    CDK and other non-Terraform files are kept verbatim after the graph.
+    :param directory: Folder to collect
+    :param collector: FileCollector with the ignore rules and size limits to apply
+    :param exclude: Subdirectories not to collect
+    :return: Tuple (payload, CollectionStats)
+    """
+    collector = collector or FileCollector()
+    terraform, others = [], []
+    stats = CollectionStats()
+    for path, content in collector.iter_files(directory, stats, exclude):
+        (terraform if path.endswith(".tf") else others).append((path, content))
+
+    payload = serialise_graph(build_graph(terraform)) if terraform else ""
+    payload += "".join(
+        f"\n{FILE_HEADER}{path}\n{content}\n" for path, content in others
+    )
+    return payload, stats
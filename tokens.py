@@ -0,0 +1,74 @@
+"""
+Token counting helpers used for the per-folder token accounting report.
+"""
+
+from functools import cache
+
+DEFAULT_ENCODING = "o200k_base"
+
+
+@cache
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = DEFAULT_ENCODING
+    try:
+        return tiktoken.get_encoding(name)
+    except (OSError, ValueError):
+        # tiktoken downloads its vocabularies on first use; offline runs estimate.
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the tokens of a text at ~4 characters per token, without a tokenizer.
+    """
+    return (len(text) + 3) // 4
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Counts the tokens of a text with the model's tokenizer.
+    Falls back to ~4 characters per token when tiktoken is not usable.
+    :param text: Text to count
+    :param model: Model whose tokenizer is used
+    :return: Number of tokens
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def messages_tokens(messages, model: str = "gpt-4o") -> int:
+    """
+    Counts the tokens of the content of a list of prompt messages.
+    """
+    return sum(count_tokens(str(message.content), model) for message in messages)
+
+
+def response_usage(response, messages, model: str = "gpt-4o"):
+    """
+    Reads the token usage reported with a model response.
+    Counts tokens locally when the provider does not report usage.
+    :param response: AIMessage returned by the model
+    :param messages: Prompt messages sent to the model
+    :param model: Model name used for local counting
+    :return: Tuple (input_tokens, output_tokens, cached_input_tokens), where
+        cached_input_tokens is the part of the input served from the provider's
+        prompt cache
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        cached = usage.get("input_token_details", {}).get("cache_read", 0)
+        return usage["input_tokens"], usage["output_tokens"], cached or 0
+    return (
+        messages_tokens(messages, model),
+        count_tokens(str(response.content), model),
+        0,
+    )
@@ -0,0 +1,286 @@
+"""
+Lightweight tracing of the documentation pipeline.
+Spans record how long each stage of a run takes (collection, prompt building,
+model calls, parsing, writing...) with attributes such as file counts, bytes,
+tokens, retries and cache hits. A run's spans are summarised per stage at the end
+of the run and can be written as an OTLP JSON trace file or sent to an OTLP/HTTP
+collector, without depending on the OpenTelemetry SDK.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+SERVICE_NAME = "infra-docs"
+OTLP_TRACES_PATH = "/v1/traces"
+OTLP_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """
+    A timed operation of a trace.
+    :param name: Stage name, e.g. "collect" or "model"
+    :param trace_id: 32 hex digits shared by every span of a run
+    :param span_id: 16 hex digits
+    :param parent_id: span_id of the enclosing span, None for the root span
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start: int = 0
+    end: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def duration(self):
+        """
+        :return: Seconds between the start and the end of the span
+        """
+        return (self.end - self.start) / 1e9
+
+    def set(self, **attributes):
+        """
+        Adds attributes to the span; None values are dropped.
+        """
+        self.attributes.update(
+            (key, value) for key, value in attributes.items() if value is not None
+        )
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Records finished spans in memory. Spans opened in a thread are parented to
+    the span that was current where the thread's context was copied from.
+    """
+
+    def __init__(self, service_name=SERVICE_NAME):
+        self.service_name = service_name
+        self.lock = threading.Lock()
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the enclosed block as a child of the current span, or as the root of
+        a new trace when there is none.
+        :param name: Stage name
+        :param attributes: Initial attributes
+        :return: Context manager yielding the Span
+        """
+        parent = _current_span.get()
+        span = Span(
+            name,
+            parent.trace_id if parent else secrets.token_hex(16),
+            secrets.token_hex(8),
+            parent.span_id if parent else None,
+        )
+        span.set(**attributes)
+        token = _current_span.set(span)
+        span.start = time.time_ns()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time_ns()
+            _current_span.reset(token)
+            with self.lock:
+                self.spans.append(span)
+
+    def trace(self, trace_id):
+        """
+        :return: Finished spans of a trace, in start order
+        """
+        with self.lock:
+            spans = [span for span in self.spans if span.trace_id == trace_id]
+        return sorted(spans, key=lambda span: span.start)
+
+    def summary(self, trace_id):
+        """
+        Aggregates the spans of a trace per stage.
+        :return: Dict stage -> dict with count, errors, total, mean and max seconds,
+            in order of first occurrence
+        """
+        stages = {}
+        for span in self.trace(trace_id):
+            stage = stages.setdefault(
+                span.name, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+            )
+            stage["count"] += 1
+            stage["errors"] += span.error is not None
+            stage["total"] += span.duration
+            stage["max"] = max(stage["max"], span.duration)
+        for stage in stages.values():
+            stage["mean"] = stage["total"] / stage["count"]
+        return stages
+
+    def log_summary(self, trace_id):
+        """
+        Logs one line per stage of a trace with its span count, errors and time.
+        """
+        logger.info(
+            "%-16s %7s %7s %10s %10s %10s",
+            "stage",
+            "spans",
+            "errors",
+            "total",
+            "mean",
+            "max",
+        )
+        for name, stage in self.summary(trace_id).items():
+            logger.info(
+                "%-16s %7d %7d %9.2fs %8.1fms %8.1fms",
+                name,
+                stage["count"],
+                stage["errors"],
+                stage["total"],
+                stage["mean"] * 1000,
+                stage["max"] * 1000,
+            )
+
+    def otlp(self, trace_id=None):
+        """
+        :param trace_id: Trace to export, None for every recorded span
+        :return: The spans as an OTLP/JSON ExportTraceServiceRequest
+        """
+        if trace_id is None:
+            with self.lock:
+                spans = list(self.spans)
+        else:
+            spans = self.trace(trace_id)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": _otlp_value(self.service_name),
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [_otlp_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write_json(self, path, trace_id=None):
+        """
+        Writes the spans to an OTLP/JSON trace file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.otlp(trace_id), f, indent=2)
+        logger.info("Trace written to %s", path)
+
+    def export_otlp(self, endpoint, trace_id=None, timeout=OTLP_TIMEOUT):
+        """
+        Sends the spans to an OTLP/HTTP collector as JSON. A collector that cannot
+        be reached is logged, never raised, so tracing cannot fail a run.
+        :param endpoint: Collector URL, e.g. http://localhost:4318; /v1/traces is
+            appended when missing
+        :return: True when the collector accepted the spans
+        """
+        url = endpoint.rstrip("/")
+        if not url.endswith(OTLP_TRACES_PATH):
+            url += OTLP_TRACES_PATH
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(self.otlp(trace_id)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout):
+                pass
+        except (OSError, urllib.error.URLError) as e:
+            logger.warning("Could not export the trace to %s: %s", url, e)
+            return False
+        logger.info("Trace exported to %s", url)
+        return True
+
+
+def _otlp_span(span):
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # SPAN_KIND_INTERNAL
+        "kind": 1,
+        "startTimeUnixNano": str(span.start),
+        "endTimeUnixNano": str(span.end),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in span.attributes.items()
+        ],
+        # STATUS_CODE_ERROR or STATUS_CODE_OK
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+tracer = Tracer()
+
+
+def span(name, **attributes):
+    """
+    Opens a span of the module tracer, see Tracer.span.
+    """
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    """
+    :return: The innermost open span of this context, None outside any span
+    """
+    return _current_span.get()
+
+
+def in_context(fn):
+    """
+    Binds `fn` to the current context, so that spans it opens in another thread
+    are parented to the current span.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time.
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run